@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Set
+
+from .manifest import OrgManifest
+from .s3_service import S3Service
+
+# Bundles older than this many versions behind latest are deleted, leaving
+# the previous one in place for devices part-way through a ranged download.
+KEEP_VERSIONS = 2
+
+logger = logging.getLogger(__name__)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def bundle_key(org: str, version: int) -> str:
+    return f"{org}/bundles/bundle-v{version}.zip"
+
+
+class OrgBundleBuilder:
+    """Build a single downloadable bundle of an org's sites.json plus ghosts.
+
+    The bundle is an uncompressed zip (the JPEGs would not shrink) holding
+    sites.json, every referenced image at its sites.json path, and a
+    manifest.json of {path: {sha256, bytes}}. Each build is published as a
+    new immutable {org}/bundles/bundle-v{n}.zip, so devices can resume with
+    HTTP Range requests, and {org}/bundles/latest.json points at it.
+
+    Every rebuild first refreshes the org manifest, and nothing is published
+    unless the manifest version moved. Image bytes come from the manifest's
+    ETag-keyed cache, so unchanged images are not downloaded again.
+    """
+
+    def __init__(self, s3: S3Service, manifest: OrgManifest):
+        self.s3 = s3
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self._running: Set[str] = set()
+        self._dirty: Set[str] = set()
+
+    def get_latest(self, org: str) -> Optional[Dict[str, Any]]:
+        return self.s3.get_bundle_latest(org)
+
+    def is_stale(self, org: str, latest: Dict[str, Any]) -> bool:
+        """True if sites.json changed since latest was built (e.g. a phone wrote it)."""
+        etag = self.s3.head_etag(f"{org}/sites.json")
+        return etag is not None and etag != latest.get("sites_etag")
+
+    def request_rebuild(self, org: str) -> None:
+        """Rebuild org's bundle, coalescing requests that arrive mid-build.
+
+        Meant to run as a background task after every sites or ghost write;
+        this is also what keeps the org manifest up to date.
+        If a build for org is already running, it is flagged to run once more
+        when done instead of building concurrently.
+        """
+        with self._lock:
+            if org in self._running:
+                self._dirty.add(org)
+                return
+            self._running.add(org)
+        while True:
+            try:
+                self.rebuild(org)
+            except Exception:
+                # Leave the previous bundle published; the next write (or a
+                # GET that finds it stale) retries.
+                logger.exception("Rebuilding the bundle for %s failed", org)
+            with self._lock:
+                if org not in self._dirty:
+                    self._running.discard(org)
+                    return
+                self._dirty.discard(org)
+
+    def rebuild(self, org: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Publish a new bundle if the manifest moved since the last one. Returns latest.json."""
+        manifest = self.manifest.refresh(org)
+        if manifest is None:
+            return None
+        sites_etag = manifest["files"]["sites.json"]["etag"]
+        previous = self.get_latest(org) or {}
+        if not force and previous.get("manifest_version") == manifest["version"]:
+            if previous.get("sites_etag") != sites_etag:
+                # Rewritten without a content change: record the ETag so the
+                # bundle is not reported stale again.
+                previous["sites_etag"] = sites_etag
+                self.s3.put_bundle_latest(org, previous)
+            return previous
+
+        version = int(previous.get("version", 0)) + 1
+        files: Dict[str, Dict[str, Any]] = {}
+        with tempfile.TemporaryFile() as tmp:
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED) as zf:
+                for path, entry in manifest["files"].items():
+                    body = self.manifest.object_bytes(f"{org}/{path}", entry["etag"])
+                    # Hash what actually went in, in case the object moved on
+                    # since the manifest was refreshed.
+                    files[path] = {"sha256": hashlib.sha256(body).hexdigest(), "bytes": len(body)}
+                    zf.writestr(path, body)
+                built_at = _now_iso()
+                zf.writestr("manifest.json", json.dumps({
+                    "org": org,
+                    "version": version,
+                    "manifest_version": manifest["version"],
+                    "built_at": built_at,
+                    "files": files,
+                }, indent=2))
+
+            size = tmp.tell()
+            digest = hashlib.sha256()
+            tmp.seek(0)
+            for chunk in iter(lambda: tmp.read(1024 * 1024), b""):
+                digest.update(chunk)
+            tmp.seek(0)
+            key = bundle_key(org, version)
+            self.s3.upload_object(key, tmp, content_type="application/zip")
+
+        latest = {
+            "org": org,
+            "version": version,
+            "manifest_version": manifest["version"],
+            "sites_etag": sites_etag,
+            "key": key,
+            "bytes": size,
+            "sha256": digest.hexdigest(),
+            "built_at": built_at,
+            "files": files,
+            "missing": manifest.get("missing", []),
+        }
+        self.s3.put_bundle_latest(org, latest)
+        self._prune(org, version)
+        return latest
+
+    def _prune(self, org: str, version: int) -> None:
+        stale = [
+            k for k in self.s3.list_keys(f"{org}/bundles/bundle-v")
+            if k.endswith(".zip") and _version_of(k) <= version - KEEP_VERSIONS
+        ]
+        for key in stale:
+            self.s3.s3.delete_object(Bucket=self.s3.bucket_name, Key=key)
+
+
+def _version_of(key: str) -> int:
+    try:
+        return int(key.rsplit("bundle-v", 1)[1].split(".", 1)[0])
+    except (IndexError, ValueError):
+        return 0
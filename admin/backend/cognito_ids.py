@@ -0,0 +1,186 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+# Only stdlib and boto3 clients are used here: the hack/cognito scripts load
+# this module by path, outside the backend package.
+
+DEFAULT_TTL_SECONDS = 3600.0
+
+T = TypeVar("T")
+
+
+def is_not_found(error: Exception) -> bool:
+    """True for Cognito's ResourceNotFoundException (a botocore ClientError)."""
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") == "ResourceNotFoundException"
+
+
+def default_cache_dir() -> Path:
+    """Cache location for the command-line tools (~/.cache/fomomon)."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "fomomon"
+
+
+class CognitoIdResolver:
+    """Name -> ID lookups for user pools, app clients and identity pools.
+
+    Each resource list is fetched in full (following NextToken) into a name
+    index, held in memory and in {cache_dir}/cognito_ids-{region}.json so
+    later runs skip the listing while it is younger than ttl_seconds. A miss
+    re-lists once before answering None, so something created elsewhere
+    since the last listing is still found and callers never create a
+    duplicate. remember()/forget() keep the index right after this process
+    creates or deletes a resource. Names that appear twice keep the first ID
+    listed, as the single-page scans did.
+
+    A hit is trusted until the TTL, so an ID deleted elsewhere (the console,
+    another machine) stays cached. Callers run the code that resolves and
+    uses IDs through retry_stale(), which re-lists and runs it again when
+    Cognito answers ResourceNotFoundException.
+
+        {"user_pools": {"fetched_at", "ids": {name: id}},
+         "identity_pools": {...},
+         "clients": {user_pool_id: {"fetched_at", "ids": {name: id}}}}
+    """
+
+    def __init__(
+        self,
+        cognito_idp: Any,
+        cognito_identity: Any,
+        cache_dir: Optional[Path] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.cognito_idp = cognito_idp
+        self.cognito_identity = cognito_identity
+        self.ttl_seconds = ttl_seconds
+        region = cognito_idp.meta.region_name or "default"
+        self.cache_path = Path(cache_dir) / f"cognito_ids-{region}.json" if cache_dir else None
+        self._lock = threading.Lock()
+        self._index: Dict[str, Any] = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        empty: Dict[str, Any] = {"user_pools": None, "identity_pools": None, "clients": {}}
+        if not self.cache_path:
+            return empty
+        try:
+            data = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return empty
+        if not isinstance(data, dict):
+            return empty
+        return {**empty, **data}
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            # The cache is an optimisation; lookups still work without it.
+            pass
+
+    def _fresh(self, entry: Optional[Dict[str, Any]]) -> bool:
+        return bool(entry) and time.time() - entry["fetched_at"] < self.ttl_seconds
+
+    def _list_user_pools(self) -> Dict[str, str]:
+        ids: Dict[str, str] = {}
+        for page in self.cognito_idp.get_paginator("list_user_pools").paginate(
+            PaginationConfig={"PageSize": 60}
+        ):
+            for pool in page.get("UserPools", []):
+                ids.setdefault(pool["Name"], pool["Id"])
+        return ids
+
+    def _list_identity_pools(self) -> Dict[str, str]:
+        ids: Dict[str, str] = {}
+        for page in self.cognito_identity.get_paginator("list_identity_pools").paginate(
+            PaginationConfig={"PageSize": 60}
+        ):
+            for pool in page.get("IdentityPools", []):
+                ids.setdefault(pool["IdentityPoolName"], pool["IdentityPoolId"])
+        return ids
+
+    def _list_clients(self, user_pool_id: str) -> Dict[str, str]:
+        ids: Dict[str, str] = {}
+        for page in self.cognito_idp.get_paginator("list_user_pool_clients").paginate(
+            UserPoolId=user_pool_id, PaginationConfig={"PageSize": 60}
+        ):
+            for client in page.get("UserPoolClients", []):
+                ids.setdefault(client["ClientName"], client["ClientId"])
+        return ids
+
+    def _lookup(self, path: tuple, name: str, fetch) -> Optional[str]:
+        with self._lock:
+            parent = self._index
+            for part in path[:-1]:
+                parent = parent.setdefault(part, {})
+            entry = parent.get(path[-1])
+            if self._fresh(entry) and name in entry["ids"]:
+                return entry["ids"][name]
+            entry = {"fetched_at": time.time(), "ids": fetch()}
+            parent[path[-1]] = entry
+            self._save()
+            return entry["ids"].get(name)
+
+    def user_pool_id(self, name: str) -> Optional[str]:
+        return self._lookup(("user_pools",), name, self._list_user_pools)
+
+    def identity_pool_id(self, name: str) -> Optional[str]:
+        return self._lookup(("identity_pools",), name, self._list_identity_pools)
+
+    def client_id(self, user_pool_id: str, name: str) -> Optional[str]:
+        return self._lookup(("clients", user_pool_id), name, lambda: self._list_clients(user_pool_id))
+
+    def _entry(self, kind: str, user_pool_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        if kind == "clients":
+            return self._index["clients"].get(user_pool_id)
+        return self._index.get(kind)
+
+    def remember(self, kind: str, name: str, resource_id: str, user_pool_id: Optional[str] = None) -> None:
+        """Record a resource this process just created.
+
+        kind is "user_pools", "identity_pools" or "clients" (with user_pool_id).
+        """
+        with self._lock:
+            entry = self._entry(kind, user_pool_id)
+            if entry:
+                entry["ids"][name] = resource_id
+                self._save()
+
+    def forget(self, kind: str, name: str, user_pool_id: Optional[str] = None) -> None:
+        """Drop a resource this process just deleted."""
+        with self._lock:
+            entry = self._entry(kind, user_pool_id)
+            removed = entry["ids"].pop(name, None) if entry else None
+            if removed is not None:
+                if kind == "user_pools":
+                    self._index["clients"].pop(removed, None)
+                self._save()
+
+    def retry_stale(self, fn: Callable[[], T]) -> T:
+        """Run fn; if Cognito reports a resource missing, drop the cache and run it once more.
+
+        fn must look its IDs up through this resolver, so the second run
+        works from fresh listings (and may create what was deleted).
+        """
+        try:
+            return fn()
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+        self.invalidate()
+        return fn()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = {"user_pools": None, "identity_pools": None, "clients": {}}
+            self._save()
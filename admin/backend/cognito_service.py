@@ -1,9 +1,35 @@
 import json
 from dataclasses import dataclass
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 
 import boto3
 
+from .cognito_ids import CognitoIdResolver
+from .cognito_throttle import cognito_client
+
+
+# Only these attributes are fetched for user listings.
+USER_ATTRIBUTES = ["email", "name", "preferred_username"]
+
+# ListUsers returns at most 60 users per call.
+MAX_USERS_PAGE = 60
+
+# Fields a user search can match (by prefix), as Cognito filter attributes.
+USER_SEARCH_FIELDS = ("username", "email", "name", "preferred_username")
+
+
+def _user_summary(user: Dict[str, object]) -> Dict[str, str]:
+    attrs = {a["Name"]: a["Value"] for a in user.get("Attributes", [])}
+    return {
+        "username": user.get("Username"),
+        "email": attrs.get("email"),
+        "name": attrs.get("name"),
+        "preferred_username": attrs.get("preferred_username"),
+        "status": user.get("UserStatus"),
+        "enabled": user.get("Enabled"),
+    }
+
 
 @dataclass
 class CognitoAppInfo:
@@ -14,45 +40,52 @@ class CognitoAppInfo:
 
 
 class CognitoService:
-    def __init__(self, app_name: str, app_type: str, region: str, bucket_name: str):
+    def __init__(
+        self,
+        app_name: str,
+        app_type: str,
+        region: str,
+        bucket_name: str,
+        id_cache_dir: Optional[Path] = None,
+    ):
         self.app_name = app_name
         self.app_type = app_type
         self.region = region
         self.bucket_name = bucket_name
-        self.cognito_idp = boto3.client("cognito-idp", region_name=region)
-        self.cognito_identity = boto3.client("cognito-identity", region_name=region)
+        self.cognito_idp = cognito_client("cognito-idp", region_name=region)
+        self.cognito_identity = cognito_client("cognito-identity", region_name=region)
         self.iam = boto3.client("iam", region_name=region)
+        self.ids = CognitoIdResolver(self.cognito_idp, self.cognito_identity, cache_dir=id_cache_dir)
 
     def get_or_create_user_pool(self) -> str:
-        pools = self.cognito_idp.list_user_pools(MaxResults=60)["UserPools"]
-        for pool in pools:
-            if pool["Name"] == f"{self.app_name}-user-pool":
-                return pool["Id"]
-        resp = self.cognito_idp.create_user_pool(PoolName=f"{self.app_name}-user-pool")
+        name = f"{self.app_name}-user-pool"
+        pool_id = self.ids.user_pool_id(name)
+        if pool_id:
+            return pool_id
+        resp = self.cognito_idp.create_user_pool(PoolName=name)
+        self.ids.remember("user_pools", name, resp["UserPool"]["Id"])
         return resp["UserPool"]["Id"]
 
     def get_or_create_user_pool_client(self, pool_id: str) -> str:
-        clients = self.cognito_idp.list_user_pool_clients(UserPoolId=pool_id, MaxResults=60)[
-            "UserPoolClients"
-        ]
-        for client in clients:
-            if client["ClientName"] == f"{self.app_name}-{self.app_type}-client":
-                try:
-                    self.cognito_idp.update_user_pool_client(
-                        UserPoolId=pool_id,
-                        ClientId=client["ClientId"],
-                        ExplicitAuthFlows=[
-                            "ALLOW_USER_PASSWORD_AUTH",
-                            "ALLOW_USER_SRP_AUTH",
-                            "ALLOW_REFRESH_TOKEN_AUTH",
-                        ],
-                    )
-                except Exception:
-                    pass
-                return client["ClientId"]
+        name = f"{self.app_name}-{self.app_type}-client"
+        client_id = self.ids.client_id(pool_id, name)
+        if client_id:
+            try:
+                self.cognito_idp.update_user_pool_client(
+                    UserPoolId=pool_id,
+                    ClientId=client_id,
+                    ExplicitAuthFlows=[
+                        "ALLOW_USER_PASSWORD_AUTH",
+                        "ALLOW_USER_SRP_AUTH",
+                        "ALLOW_REFRESH_TOKEN_AUTH",
+                    ],
+                )
+            except Exception:
+                pass
+            return client_id
         resp = self.cognito_idp.create_user_pool_client(
             UserPoolId=pool_id,
-            ClientName=f"{self.app_name}-{self.app_type}-client",
+            ClientName=name,
             GenerateSecret=False,
             ExplicitAuthFlows=[
                 "ALLOW_USER_PASSWORD_AUTH",
@@ -60,16 +93,17 @@ class CognitoService:
                 "ALLOW_REFRESH_TOKEN_AUTH",
             ],
         )
+        self.ids.remember("clients", name, resp["UserPoolClient"]["ClientId"], user_pool_id=pool_id)
         return resp["UserPoolClient"]["ClientId"]
 
     def get_or_create_identity_pool(self, user_pool_id: str, client_id: str) -> str:
-        pools = self.cognito_identity.list_identity_pools(MaxResults=60)["IdentityPools"]
-        for pool in pools:
-            if pool["IdentityPoolName"] == f"{self.app_name}-identity-pool":
-                return pool["IdentityPoolId"]
+        name = f"{self.app_name}-identity-pool"
+        identity_pool_id = self.ids.identity_pool_id(name)
+        if identity_pool_id:
+            return identity_pool_id
 
         resp = self.cognito_identity.create_identity_pool(
-            IdentityPoolName=f"{self.app_name}-identity-pool",
+            IdentityPoolName=name,
             AllowUnauthenticatedIdentities=False,
             CognitoIdentityProviders=[
                 {
@@ -78,6 +112,7 @@ class CognitoService:
                 }
             ],
         )
+        self.ids.remember("identity_pools", name, resp["IdentityPoolId"])
         return resp["IdentityPoolId"]
 
     def get_or_create_role(self, identity_pool_id: str, write_access: bool) -> str:
@@ -143,6 +178,10 @@ class CognitoService:
         )
 
     def ensure_app_setup(self, write_access: bool = True) -> CognitoAppInfo:
+        # A cached ID may name a resource deleted since; re-list and retry once.
+        return self.ids.retry_stale(lambda: self._ensure_app_setup(write_access))
+
+    def _ensure_app_setup(self, write_access: bool) -> CognitoAppInfo:
         user_pool_id = self.get_or_create_user_pool()
         client_id = self.get_or_create_user_pool_client(user_pool_id)
         identity_pool_id = self.get_or_create_identity_pool(user_pool_id, client_id)
@@ -158,21 +197,37 @@ class CognitoService:
     def list_users(self, user_pool_id: str) -> List[Dict[str, str]]:
         users: List[Dict[str, str]] = []
         paginator = self.cognito_idp.get_paginator("list_users")
-        for page in paginator.paginate(UserPoolId=user_pool_id):
-            for user in page.get("Users", []):
-                attrs = {a["Name"]: a["Value"] for a in user.get("Attributes", [])}
-                users.append(
-                    {
-                        "username": user.get("Username"),
-                        "email": attrs.get("email"),
-                        "name": attrs.get("name"),
-                        "preferred_username": attrs.get("preferred_username"),
-                        "status": user.get("UserStatus"),
-                        "enabled": user.get("Enabled"),
-                    }
-                )
+        for page in paginator.paginate(UserPoolId=user_pool_id, AttributesToGet=USER_ATTRIBUTES):
+            users.extend(_user_summary(user) for user in page.get("Users", []))
         return users
 
+    def list_users_page(
+        self,
+        user_pool_id: str,
+        limit: int = MAX_USERS_PAGE,
+        cursor: Optional[str] = None,
+        q: Optional[str] = None,
+        field: str = "username",
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """One ListUsers call: (users, next_cursor), next_cursor None at the end.
+
+        q filters server-side to users whose `field` starts with q. The
+        cursor is Cognito's PaginationToken and is only valid with the same
+        q and field.
+        """
+        kwargs = {
+            "UserPoolId": user_pool_id,
+            "Limit": limit,
+            "AttributesToGet": USER_ATTRIBUTES,
+        }
+        if cursor:
+            kwargs["PaginationToken"] = cursor
+        if q:
+            value = q.replace("\\", "\\\\").replace('"', '\\"')
+            kwargs["Filter"] = f'{field} ^= "{value}"'
+        resp = self.cognito_idp.list_users(**kwargs)
+        return [_user_summary(u) for u in resp.get("Users", [])], resp.get("PaginationToken")
+
     def add_user(
         self,
         user_pool_id: str,
@@ -181,6 +236,18 @@ class CognitoService:
         email: str,
         password: str,
     ) -> None:
+        self.create_user(user_pool_id, username, name, email, password)
+        self.update_password(user_pool_id, username, password)
+
+    def create_user(
+        self,
+        user_pool_id: str,
+        username: str,
+        name: str,
+        email: str,
+        password: str,
+    ) -> None:
+        """admin_create_user only; the password stays temporary until update_password."""
         username = username.lower()
         self.cognito_idp.admin_create_user(
             UserPoolId=user_pool_id,
@@ -193,12 +260,6 @@ class CognitoService:
             ],
             MessageAction="SUPPRESS",
         )
-        self.cognito_idp.admin_set_user_password(
-            UserPoolId=user_pool_id,
-            Username=username,
-            Password=password,
-            Permanent=True,
-        )
 
     def delete_user(self, user_pool_id: str, username: str) -> None:
         self.cognito_idp.admin_delete_user(
@@ -215,31 +276,15 @@ class CognitoService:
         )
 
     def get_app_info(self) -> Optional[CognitoAppInfo]:
-        user_pool_id = None
-        pools = self.cognito_idp.list_user_pools(MaxResults=60)["UserPools"]
-        for pool in pools:
-            if pool["Name"] == f"{self.app_name}-user-pool":
-                user_pool_id = pool["Id"]
-                break
+        return self.ids.retry_stale(self._get_app_info)
 
+    def _get_app_info(self) -> Optional[CognitoAppInfo]:
+        user_pool_id = self.ids.user_pool_id(f"{self.app_name}-user-pool")
         if not user_pool_id:
             return None
 
-        client_id = None
-        clients = self.cognito_idp.list_user_pool_clients(
-            UserPoolId=user_pool_id, MaxResults=60
-        )["UserPoolClients"]
-        for client in clients:
-            if client["ClientName"] == f"{self.app_name}-{self.app_type}-client":
-                client_id = client["ClientId"]
-                break
-
-        identity_pool_id = None
-        pools = self.cognito_identity.list_identity_pools(MaxResults=60)["IdentityPools"]
-        for pool in pools:
-            if pool["IdentityPoolName"] == f"{self.app_name}-identity-pool":
-                identity_pool_id = pool["IdentityPoolId"]
-                break
+        client_id = self.ids.client_id(user_pool_id, f"{self.app_name}-{self.app_type}-client")
+        identity_pool_id = self.ids.identity_pool_id(f"{self.app_name}-identity-pool")
 
         role_name = f"{self.app_name}-{self.app_type}-role"
         try:
@@ -0,0 +1,178 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+try:
+    from .rate_limit import TokenBucket
+except ImportError:
+    # Loaded by path from the hack/cognito scripts, outside the package.
+    from rate_limit import TokenBucket
+
+# Cognito user pool quotas are per account and region, shared by every
+# caller, and grouped into categories (AdminCreateUser counts against
+# UserCreation, ListUsers against UserList, ...). Rates here are requests per
+# second held well under the default quota of each category.
+CATEGORY_RPS = {
+    "UserCreation": 20.0,         # quota 50
+    "UserUpdate": 10.0,           # quota 25
+    "UserDeletion": 10.0,         # quota 25
+    "UserRead": 50.0,             # quota 120
+    "UserList": 10.0,             # quota 30
+    "UserAuthentication": 50.0,   # quota 120
+    "UserPoolRead": 5.0,          # quota 15
+    "UserPoolUpdate": 5.0,        # quota 15
+    "UserPoolClientRead": 5.0,    # quota 15
+    "UserPoolClientUpdate": 5.0,  # quota 15
+    # Identity pool APIs are throttled per operation with no published
+    # quota categories; one conservative bucket covers them.
+    "IdentityPool": 5.0,
+}
+
+OPERATION_CATEGORY = {
+    "AdminCreateUser": "UserCreation",
+    "SignUp": "UserCreation",
+    "AdminSetUserPassword": "UserUpdate",
+    "AdminUpdateUserAttributes": "UserUpdate",
+    "AdminEnableUser": "UserUpdate",
+    "AdminDisableUser": "UserUpdate",
+    "AdminDeleteUser": "UserDeletion",
+    "AdminGetUser": "UserRead",
+    "ListUsers": "UserList",
+    "InitiateAuth": "UserAuthentication",
+    "AdminInitiateAuth": "UserAuthentication",
+    "RespondToAuthChallenge": "UserAuthentication",
+    "ListUserPools": "UserPoolRead",
+    "DescribeUserPool": "UserPoolRead",
+    "CreateUserPool": "UserPoolUpdate",
+    "UpdateUserPool": "UserPoolUpdate",
+    "DeleteUserPool": "UserPoolUpdate",
+    "ListUserPoolClients": "UserPoolClientRead",
+    "DescribeUserPoolClient": "UserPoolClientRead",
+    "CreateUserPoolClient": "UserPoolClientUpdate",
+    "UpdateUserPoolClient": "UserPoolClientUpdate",
+    "DeleteUserPoolClient": "UserPoolClientUpdate",
+}
+
+# LimitExceededException is a resource quota (e.g. too many pools), not a
+# rate limit, so it is an ordinary error here.
+THROTTLE_CODES = ("TooManyRequestsException", "ThrottlingException")
+
+# botocore's standard retry mode: exponential backoff with full jitter, on
+# throttling and transient errors. Each retry also waits for a token below.
+# total_max_attempts counts the first call; max_attempts would count retries.
+RETRY_CONFIG = Config(retries={"mode": "standard", "total_max_attempts": 8})
+
+# On a throttle a category's rate is halved, down to this fraction of its
+# configured rate, then recovers by RECOVERY_STEP of it per success. The
+# burst follows the rate, so a backed-off bucket cannot refill to a full
+# second's worth of the configured rate and release it at once.
+MIN_RATE_FRACTION = 0.1
+RECOVERY_STEP = 0.02
+
+COGNITO_SERVICES = ("cognito-idp", "cognito-identity")
+
+
+class CognitoThrottle:
+    """Client-side rate limiting for Cognito, shared by every client it instruments.
+
+    instrument() hooks botocore events on a client: each request attempt
+    (including retries and paginator pages) first takes a token from its
+    category's bucket; a throttling error halves that bucket's rate and
+    successes bring it back up. Retries themselves are botocore's, with
+    jittered exponential backoff. stats() reports per-operation counters.
+    """
+
+    def __init__(self, category_rps: Optional[Dict[str, float]] = None):
+        self.category_rps = {**CATEGORY_RPS, **(category_rps or {})}
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        # operation -> {"attempts", "throttled", "errors", "wait_seconds", "last_throttled_at"}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _category(service: str, operation: str) -> str:
+        if service == "cognito-identity":
+            return "IdentityPool"
+        return OPERATION_CATEGORY.get(operation, "UserPoolRead")
+
+    def _bucket(self, category: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(category)
+            if bucket is None:
+                rate = self.category_rps[category]
+                bucket = self._buckets[category] = TokenBucket(rate, burst=rate)
+            return bucket
+
+    def _stat(self, operation: str) -> Dict[str, Any]:
+        stat = self._stats.get(operation)
+        if stat is None:
+            stat = self._stats[operation] = {
+                "attempts": 0, "throttled": 0, "errors": 0, "wait_seconds": 0.0, "last_throttled_at": None,
+            }
+        return stat
+
+    def instrument(self, client: Any) -> Any:
+        service = client.meta.service_model.service_name
+        if service not in COGNITO_SERVICES:
+            raise ValueError(f"Not a Cognito client: {service}")
+        service_id = client.meta.service_model.service_id.hyphenize()
+        events = client.meta.events
+        events.register(f"before-send.{service_id}", lambda event_name, **kw: self._before_send(
+            service, event_name.rsplit(".", 1)[1]))
+        events.register(f"needs-retry.{service_id}", lambda operation, response=None, **kw: self._after_attempt(
+            service, operation.name, response))
+        return client
+
+    def _before_send(self, service: str, operation: str) -> None:
+        started = time.monotonic()
+        self._bucket(self._category(service, operation)).acquire()
+        waited = time.monotonic() - started
+        with self._lock:
+            stat = self._stat(operation)
+            stat["attempts"] += 1
+            stat["wait_seconds"] += waited
+
+    def _after_attempt(self, service: str, operation: str, response: Optional[tuple]) -> None:
+        # Called once per attempt, before botocore decides whether to retry.
+        # Returning None leaves that decision to botocore.
+        category = self._category(service, operation)
+        bucket = self._bucket(category)
+        base = self.category_rps[category]
+        code = None
+        if response is not None:
+            code = (response[1] or {}).get("Error", {}).get("Code")
+        with self._lock:
+            stat = self._stat(operation)
+            if code in THROTTLE_CODES:
+                stat["throttled"] += 1
+                stat["last_throttled_at"] = time.time()
+                rate = max(base * MIN_RATE_FRACTION, bucket.rate / 2)
+                bucket.set_rate(rate, burst=rate)
+            elif response is None or code:
+                stat["errors"] += 1
+            elif bucket.rate < base:
+                rate = min(base, bucket.rate + base * RECOVERY_STEP)
+                bucket.set_rate(rate, burst=rate)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "operations": {op: dict(stat) for op, stat in sorted(self._stats.items())},
+                "rates": {
+                    category: {"configured": self.category_rps[category], "current": round(bucket.rate, 3)}
+                    for category, bucket in sorted(self._buckets.items())
+                },
+            }
+
+
+# One throttle per process, so every client draws on the same buckets.
+throttle = CognitoThrottle()
+
+
+def cognito_client(service: str, **kwargs: Any) -> Any:
+    """boto3 client for cognito-idp / cognito-identity behind the shared throttle."""
+    return throttle.instrument(boto3.client(service, config=RETRY_CONFIG, **kwargs))
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class DiskCache:
+    """Size-bounded LRU cache of immutable blobs on local disk.
+
+    Entries are addressed by (name, version) — for S3 objects the object key
+    and its ETag — so a rewritten object simply misses and the stale entry
+    ages out. Recency is tracked in memory and seeded from file mtimes on
+    startup, so the cache survives server restarts.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        files = []
+        for path in self.root.iterdir():
+            if path.is_file() and not path.name.endswith(".tmp"):
+                st = path.stat()
+                files.append((st.st_mtime, path.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def _entry_name(name: str, version: str) -> str:
+        return hashlib.sha256(f"{name}\0{version}".encode("utf-8")).hexdigest()
+
+    def get(self, name: str, version: str) -> Optional[bytes]:
+        entry = self._entry_name(name, version)
+        with self._lock:
+            if entry not in self._entries:
+                return None
+            self._entries.move_to_end(entry)
+        path = self.root / entry
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._entries.pop(entry, 0)
+            return None
+        return data
+
+    def put(self, name: str, version: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        entry = self._entry_name(name, version)
+        path = self.root / entry
+        tmp = path.with_name(f"{entry}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size -= self._entries.pop(entry, 0)
+            self._entries[entry] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            entry, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                (self.root / entry).unlink()
+            except FileNotFoundError:
+                pass
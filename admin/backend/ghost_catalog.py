@@ -0,0 +1,127 @@
+import hashlib
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Optional, Set
+
+from PIL import Image
+
+from .s3_service import S3Service
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def describe_image(fileobj: BinaryIO) -> Dict[str, Any]:
+    """Hash, size and (EXIF-oriented) dimensions of an image, rewinding fileobj.
+
+    Reads the file in 1 MB chunks for the hash; Pillow only parses the header
+    for the dimensions, so nothing is fully decoded or held in memory.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    width = height = None
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as img:
+            width, height = img.size
+            if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+    except Exception:
+        pass
+    fileobj.seek(0)
+    return {"sha256": digest.hexdigest(), "bytes": size, "width": width, "height": height}
+
+
+class GhostCatalog:
+    """Per-site index of uploaded reference images at {org}/{site_id}/ghosts.json.
+
+    The site prefix also holds every session photo, so listing it grows with
+    each field visit. Name allocation and the admin gallery read this catalog
+    instead. Updates are serialised per site within this process; the lock
+    is only held to pick a name and to record the upload, never across the
+    upload itself. Names handed out but not yet recorded are reserved in
+    memory so concurrent uploads to a site never pick the same one.
+    """
+
+    def __init__(self, s3: S3Service):
+        self.s3 = s3
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self._reserved: Dict[str, Set[str]] = defaultdict(set)
+
+    def lock(self, org: str, site_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[f"{org}/{site_id}"]
+
+    def get(self, org: str, site_id: str) -> Dict[str, Any]:
+        catalog = self.s3.get_ghost_catalog(org, site_id)
+        return catalog or {"org": org, "site_id": site_id, "images": [], "updated_at": None}
+
+    def allocate_name(self, catalog: Dict[str, Any], stamp: str, base: str, ext: str) -> str:
+        """First free {stamp}-{base}-{n}{ext} not in the catalog, reserved, or already in S3.
+
+        The HEAD guards against objects uploaded before the catalog existed;
+        it is a single request per candidate rather than a prefix listing.
+        """
+        taken = {img["filename"] for img in catalog.get("images", [])}
+        taken |= self._reserved[f"{catalog['org']}/{catalog['site_id']}"]
+        prefix = f"{catalog['org']}/{catalog['site_id']}/"
+        index = 1
+        while True:
+            candidate = f"{stamp}-{base}-{index}{ext}"
+            if candidate not in taken and self.s3.head_etag(f"{prefix}{candidate}") is None:
+                return candidate
+            index += 1
+
+    def reserve(self, org: str, site_id: str, stamp: str, base: str, ext: str) -> str:
+        """Allocate a name and hold it until record() or release()."""
+        with self.lock(org, site_id):
+            name = self.allocate_name(self.get(org, site_id), stamp, base, ext)
+            self._reserved[f"{org}/{site_id}"].add(name)
+            return name
+
+    def release(self, org: str, site_id: str, filename: str) -> None:
+        with self.lock(org, site_id):
+            self._reserved[f"{org}/{site_id}"].discard(filename)
+
+    def record(
+        self,
+        org: str,
+        site_id: str,
+        filename: str,
+        orientation: str,
+        info: Dict[str, Any],
+        content_type: Optional[str],
+    ) -> Dict[str, Any]:
+        """Add an uploaded image to a fresh copy of the catalog and drop its reservation."""
+        with self.lock(org, site_id):
+            entry = self.add(self.get(org, site_id), filename, orientation, info, content_type)
+            self._reserved[f"{org}/{site_id}"].discard(filename)
+            return entry
+
+    def add(
+        self,
+        catalog: Dict[str, Any],
+        filename: str,
+        orientation: str,
+        info: Dict[str, Any],
+        content_type: Optional[str],
+    ) -> Dict[str, Any]:
+        entry = {
+            "filename": filename,
+            "path": f"{catalog['site_id']}/{filename}",
+            "orientation": orientation,
+            "content_type": content_type,
+            "uploaded_at": _now_iso(),
+            **info,
+        }
+        catalog.setdefault("images", []).append(entry)
+        catalog["updated_at"] = entry["uploaded_at"]
+        self.s3.put_ghost_catalog(catalog["org"], catalog["site_id"], catalog)
+        return entry
@@ -0,0 +1,269 @@
+import io
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps
+
+from .s3_service import S3Service, WriteConflict
+
+# Longest edge in pixels per variant. Originals smaller than a size are not upscaled.
+VARIANT_SIZES = {"large": 1600, "medium": 1024, "thumb": 320}
+
+VARIANT_FORMATS = {
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "progressive": True, "optimize": True}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+}
+
+# Default screen aspect ratios (short:long edge) of common phones: 3:4 tablets,
+# 9:16 older phones, 9:19.5 and 9:20 current notched/edge-to-edge phones.
+DEFAULT_CROP_RATIOS = ["3:4", "9:16", "9:19.5", "9:20"]
+
+# Longest edge of a crop. Crops are for overlay on a camera preview, which is
+# never shown much larger than the screen.
+CROP_MAX_EDGE = 1600
+
+
+def parse_ratio(ratio: str) -> Tuple[float, float]:
+    """'9:19.5' -> (9.0, 19.5). Raises ValueError on malformed input."""
+    short, sep, long = ratio.partition(":")
+    if not sep:
+        raise ValueError(f"Invalid aspect ratio {ratio!r}; expected e.g. 9:16")
+    a, b = float(short), float(long)
+    if a <= 0 or b <= 0:
+        raise ValueError(f"Invalid aspect ratio {ratio!r}")
+    return min(a, b), max(a, b)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def variant_dir(relative_path: str) -> str:
+    """site_001/20240115-building-1.jpg -> site_001/variants/20240115-building-1/"""
+    site_dir, _, filename = relative_path.rpartition("/")
+    stem = filename.rsplit(".", 1)[0] if "." in filename else filename
+    return f"{site_dir}/variants/{stem}/" if site_dir else f"variants/{stem}/"
+
+
+def reference_paths(sites_json: Optional[Dict[str, Any]]) -> List[str]:
+    """All distinct reference image paths named in a sites.json document."""
+    paths = set()
+    for site in (sites_json or {}).get("sites", []):
+        for field in ("reference_portrait", "reference_landscape"):
+            if site.get(field):
+                paths.add(site[field].lstrip("/"))
+    return sorted(paths)
+
+
+def _encode(img: Image.Image, **fields: Any) -> List[Dict[str, Any]]:
+    out = []
+    for ext, (fmt, content_type, options) in VARIANT_FORMATS.items():
+        buf = io.BytesIO()
+        img.save(buf, fmt, **options)
+        out.append({
+            **fields,
+            "format": ext,
+            "content_type": content_type,
+            "width": img.width,
+            "height": img.height,
+            "body": buf.getvalue(),
+        })
+    return out
+
+
+def crop_to_ratio(img: Image.Image, ratio: Tuple[float, float], max_edge: int) -> Image.Image:
+    """Centre crop img to ratio (matched to img's orientation), then scale uniformly.
+
+    This is what BoxFit.cover does on the phone: the centre stays the centre
+    and both axes get the same scale, so the app can draw the result edge to
+    edge with no transform.
+    """
+    short, long = ratio
+    target = short / long if img.width <= img.height else long / short
+    if img.width / img.height > target:
+        crop_w, crop_h = round(img.height * target), img.height
+    else:
+        crop_w, crop_h = img.width, round(img.width / target)
+    scale = min(1.0, max_edge / max(crop_w, crop_h))
+    size = (max(1, round(crop_w * scale)), max(1, round(crop_h * scale)))
+    return ImageOps.fit(img, size, Image.LANCZOS, centering=(0.5, 0.5))
+
+
+def render_variants(data: bytes, crop_ratios: Sequence[str] = ()) -> Dict[str, Any]:
+    """Decode an image and encode every size/format variant and aspect crop.
+
+    The EXIF orientation is applied to the pixels and all metadata is
+    dropped, so clients never need to rotate. Returns {width, height,
+    variants: [...], crops: [...]}, each entry {name, format, content_type,
+    width, height, body}; crops also carry their `ratio`.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):  # rotated 90/270 degrees
+            width, height = height, width
+        # Let the JPEG decoder downscale by a power of two while decoding;
+        # the result is still at least as large as the biggest variant.
+        edge = max(VARIANT_SIZES.values())
+        img.draft("RGB", (edge, edge))
+        oriented = ImageOps.exif_transpose(img)
+        if oriented.mode != "RGB":
+            oriented = oriented.convert("RGB")
+    crops = []
+    for ratio in crop_ratios:
+        short, long = parse_ratio(ratio)
+        cropped = crop_to_ratio(oriented, (short, long), CROP_MAX_EDGE)
+        crops.extend(_encode(cropped, name=f"crop-{short:g}x{long:g}", ratio=ratio))
+
+    variants = []
+    # Largest first so each step downsamples the previous, smaller, image.
+    current = oriented
+    for name, edge in sorted(VARIANT_SIZES.items(), key=lambda kv: -kv[1]):
+        current = current.copy()
+        current.thumbnail((edge, edge), Image.LANCZOS)
+        variants.extend(_encode(current, name=name))
+    return {"width": width, "height": height, "variants": variants, "crops": crops}
+
+
+class GhostVariantService:
+    """Generate and publish mobile-sized variants of org reference images.
+
+    Variants and per-aspect-ratio crops live at
+    {org}/{site_id}/variants/{stem}/{name}.{jpg,webp} and are indexed in the
+    {org}/ghost_variants.json sidecar, keyed by the reference's relative path
+    as it appears in sites.json, so clients can pick a size or a crop
+    matching their screen without sites.json changing shape.
+    """
+
+    def __init__(
+        self,
+        s3: S3Service,
+        workers: Optional[int] = None,
+        crop_ratios: Sequence[str] = DEFAULT_CROP_RATIOS,
+    ):
+        self.s3 = s3
+        self.workers = workers or min(8, (os.cpu_count() or 2))
+        for ratio in crop_ratios:
+            parse_ratio(ratio)
+        self.crop_ratios = list(crop_ratios)
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    def _lock(self, org: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[org]
+
+    def build(self, org: str, relative_path: str) -> Dict[str, Any]:
+        """Render and upload variants for one reference. Returns its sidecar record."""
+        key = f"{org}/{relative_path}"
+        resp = self.s3.s3.get_object(Bucket=self.s3.bucket_name, Key=key)
+        rendered = render_variants(resp["Body"].read(), self.crop_ratios)
+        base = variant_dir(relative_path)
+        record: Dict[str, Any] = {
+            "source_etag": resp.get("ETag", ""),
+            "width": rendered["width"],
+            "height": rendered["height"],
+            "generated_at": _now_iso(),
+            "variants": [],
+            "crops": [],
+        }
+        for group in ("variants", "crops"):
+            for v in rendered[group]:
+                path = f"{base}{v['name']}.{v['format']}"
+                self.s3.s3.put_object(
+                    Bucket=self.s3.bucket_name,
+                    Key=f"{org}/{path}",
+                    Body=v["body"],
+                    ContentType=v["content_type"],
+                )
+                entry = {
+                    "name": v["name"],
+                    "format": v["format"],
+                    "path": path,
+                    "width": v["width"],
+                    "height": v["height"],
+                    "bytes": len(v["body"]),
+                }
+                if "ratio" in v:
+                    entry["ratio"] = v["ratio"]
+                record[group].append(entry)
+        return record
+
+    def build_and_record(self, org: str, relative_path: str) -> Dict[str, Any]:
+        record = self.build(org, relative_path)
+        self._record(org, {relative_path: record})
+        return record
+
+    def backfill(
+        self,
+        org: str,
+        paths: Iterable[str],
+        force: bool = False,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Build variants for many references on a worker pool.
+
+        References whose sidecar record matches the object's current ETag are
+        skipped unless force. The sidecar is written once at the end.
+        """
+        index = self.s3.get_ghost_variants_json(org) or {}
+        known = index.get("images", {})
+        todo = []
+        skipped = 0
+        for path in paths:
+            if not force and path in known:
+                etag = self.s3.head_etag(f"{org}/{path}")
+                if etag and etag == known[path].get("source_etag"):
+                    skipped += 1
+                    continue
+            todo.append(path)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        errors: List[Dict[str, str]] = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.build, org, path): path for path in todo}
+            for fut in as_completed(futures):
+                path = futures[fut]
+                try:
+                    results[path] = fut.result()
+                except Exception as e:
+                    errors.append({"path": path, "error": str(e)})
+                if progress:
+                    progress({
+                        "done": len(results),
+                        "failed": len(errors),
+                        "skipped": skipped,
+                        "total": len(todo) + skipped,
+                    })
+
+        if results:
+            self._record(org, results)
+        return {"built": len(results), "skipped": skipped, "failed": len(errors), "errors": errors}
+
+    def _record(self, org: str, records: Dict[str, Dict[str, Any]], max_attempts: int = 5) -> None:
+        """Merge records into the sidecar with an ETag-guarded read-modify-write.
+
+        Upload builds and backfills run concurrently; the per-org lock orders
+        them within this process and the conditional write catches writers
+        elsewhere, whose changes are re-read and merged on a conflict.
+        """
+        key = f"{org}/ghost_variants.json"
+        with self._lock(org):
+            for attempt in range(1, max_attempts + 1):
+                obj = self.s3.get_object_bytes(key)
+                index, etag = (json.loads(obj[0].decode("utf-8")), obj[1]) if obj else ({"org": org}, None)
+                index.setdefault("images", {}).update(records)
+                index["updated_at"] = _now_iso()
+                try:
+                    self.s3.put_json_if_match(key, index, etag)
+                    return
+                except WriteConflict:
+                    if attempt == max_attempts:
+                        raise
+                    time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
@@ -0,0 +1,80 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .disk_cache import DiskCache
+from .s3_service import S3Service
+
+# Requested widths are rounded up to one of these so the cache holds a few
+# renditions per image rather than one per pixel width.
+WIDTH_BUCKETS = (160, 320, 480, 640, 960, 1280, 1920)
+
+
+def snap_width(width: int) -> int:
+    for bucket in WIDTH_BUCKETS:
+        if width <= bucket:
+            return bucket
+    return WIDTH_BUCKETS[-1]
+
+
+class UnsupportedImage(ValueError):
+    """The object could not be decoded as an image."""
+
+
+def resize_jpeg(data: bytes, width: int) -> bytes:
+    """Orient, downscale to at most `width` px wide and re-encode as progressive JPEG.
+
+    Raises UnsupportedImage if Pillow cannot decode data.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", (width, width))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        # Unknown formats, truncated or corrupt files, oversized images.
+        raise UnsupportedImage(str(e)) from e
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80, progressive=True, optimize=True)
+    return buf.getvalue()
+
+
+class ImageProxy:
+    """Serve downscaled copies of S3 images for the admin UI.
+
+    Each rendition is cached on disk under (key, "{etag}:w{width}"), so an
+    object is fetched from S3 and resized once per width until it changes.
+    Resizing runs on a dedicated pool sized to the CPU count, which also caps
+    how many full-size originals are decoded at once.
+    """
+
+    def __init__(self, s3: S3Service, cache: DiskCache, workers: int = 0):
+        self.s3 = s3
+        self.cache = cache
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or (os.cpu_count() or 2), thread_name_prefix="img-resize"
+        )
+
+    def etag(self, key: str) -> str:
+        """Current ETag of key; raises ClientError (404) if it does not exist."""
+        return self.s3.s3.head_object(Bucket=self.s3.bucket_name, Key=key)["ETag"]
+
+    def get(self, key: str, width: int, etag: str) -> Tuple[bytes, Dict[str, str]]:
+        """Return (jpeg_bytes, info) for key at width; info has `cache` = hit/miss."""
+        version = f"{etag}:w{width}"
+        body = self.cache.get(key, version)
+        if body is not None:
+            return body, {"cache": "hit"}
+        resp = self.s3.s3.get_object(Bucket=self.s3.bucket_name, Key=key)
+        original = resp["Body"].read()
+        body = self.pool.submit(resize_jpeg, original, width).result()
+        # Key the rendition by the ETag of the bytes actually resized, in case
+        # the object changed since the caller's HEAD.
+        self.cache.put(key, f"{resp.get('ETag', etag)}:w{width}", body)
+        return body, {"cache": "miss"}
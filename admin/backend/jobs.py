@@ -0,0 +1,65 @@
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class JobRegistry:
+    """In-memory registry of long-running admin jobs.
+
+    Jobs run in FastAPI background tasks and report progress by updating
+    their record here; clients poll GET /api/jobs/{job_id}. State is lost on
+    restart, which is acceptable for idempotent cleanup work that can simply
+    be re-run.
+    """
+
+    def __init__(self, max_jobs: int = 200):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def create(self, kind: str, org: str, **fields: Any) -> Dict[str, Any]:
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "org": org,
+            "status": "pending",
+            "created_at": _now_iso(),
+            "finished_at": None,
+            "error": None,
+            **fields,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._trim()
+            return dict(job)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            if fields.get("status") in ("succeeded", "failed"):
+                job["finished_at"] = _now_iso()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, org: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(j) for j in self._jobs.values() if org is None or j["org"] == org]
+
+    def _trim(self) -> None:
+        # Drop the oldest finished jobs once over the limit; dicts keep insertion order.
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [k for k, j in self._jobs.items() if j["finished_at"]][:excess]:
+            del self._jobs[job_id]
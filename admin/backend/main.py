@@ -1,12 +1,15 @@
+import hashlib
 import json
+import logging
 import os
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timezone
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 import re
@@ -14,8 +17,22 @@ from dotenv import load_dotenv
 import boto3
 from botocore.exceptions import ClientError
 
-from .cognito_service import CognitoService
-from .s3_service import S3Service
+from .bundles import OrgBundleBuilder
+from .cognito_service import MAX_USERS_PAGE, USER_SEARCH_FIELDS, CognitoService
+from .cognito_throttle import cognito_client, throttle as cognito_throttle
+from .disk_cache import DiskCache
+from .ghost_catalog import GhostCatalog, describe_image
+from .ghost_variants import DEFAULT_CROP_RATIOS, GhostVariantService, reference_paths
+from .image_proxy import ImageProxy, UnsupportedImage, snap_width
+from .jobs import JobRegistry
+from .manifest import OrgManifest
+from .s3_service import S3Service, WriteConflict, decode_telemetry_cursor
+from .site_geo import NearbySites
+from .site_tiles import DEFAULT_TILE_PRECISION, SiteTiles
+from .sites_store import SitesStore, sites_missing_ids
+from .telemetry_ingest import TelemetryIngestor
+from .user_import import UserImporter, parse_user_rows
+from .users_store import UsersJsonWriter
 
 
 ADMIN_ROOT = Path(__file__).resolve().parents[1]
@@ -23,11 +40,34 @@ FRONTEND_DIR = ADMIN_ROOT / "frontend"
 ENV_PATH = ADMIN_ROOT / ".env"
 load_dotenv(ENV_PATH)
 
+logger = logging.getLogger(__name__)
+
 AWS_REGION = os.getenv("AWS_REGION")
 BUCKET_NAME = os.getenv("FOMOMON_BUCKET")
 AUTH_CONFIG_KEY = os.getenv("AUTH_CONFIG_KEY") or "auth_config.json"
+CACHE_DIR = Path(os.getenv("FOMOMON_CACHE_DIR") or ADMIN_ROOT / ".cache")
+TELEMETRY_CACHE_MAX_MB = int(os.getenv("TELEMETRY_CACHE_MAX_MB") or "256")
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB") or "512")
+BUNDLE_CACHE_MAX_MB = int(os.getenv("BUNDLE_CACHE_MAX_MB") or "1024")
+SITE_TILE_PRECISION = int(os.getenv("SITE_TILE_PRECISION") or str(DEFAULT_TILE_PRECISION))
+GHOST_CROP_RATIOS = [
+    r.strip() for r in (os.getenv("GHOST_CROP_RATIOS") or ",".join(DEFAULT_CROP_RATIOS)).split(",")
+    if r.strip()
+]
+TELEMETRY_INGEST = (os.getenv("TELEMETRY_INGEST") or "").lower() in ("1", "true", "yes")
+TELEMETRY_INGEST_MAX_MB = int(os.getenv("TELEMETRY_INGEST_MAX_MB") or "64")
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    if telemetry_ingestor:
+        telemetry_ingestor.start()
+    yield
+    if telemetry_ingestor:
+        telemetry_ingestor.stop()
+
 
-app = FastAPI(title="Fomomon Admin", version="0.1.0")
+app = FastAPI(title="Fomomon Admin", version="0.1.0", lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,9 +82,33 @@ cognito = CognitoService(
     app_type="",
     region=AWS_REGION or "",
     bucket_name=BUCKET_NAME or "",
+    id_cache_dir=CACHE_DIR / "cognito",
 )
 
-s3 = S3Service(bucket_name=BUCKET_NAME or "", region=AWS_REGION or "")
+s3 = S3Service(
+    bucket_name=BUCKET_NAME or "",
+    region=AWS_REGION or "",
+    cache=DiskCache(CACHE_DIR / "telemetry", TELEMETRY_CACHE_MAX_MB * 1024 * 1024)
+    if TELEMETRY_CACHE_MAX_MB > 0
+    else None,
+)
+
+jobs = JobRegistry()
+ghost_variants = GhostVariantService(s3, crop_ratios=GHOST_CROP_RATIOS)
+ghost_catalog = GhostCatalog(s3)
+sites_store = SitesStore(s3)
+nearby_sites = NearbySites(s3)
+user_importer = UserImporter(cognito)
+users_writer = UsersJsonWriter(s3)
+site_tiles = SiteTiles(s3, precision=SITE_TILE_PRECISION)
+manifests = OrgManifest(s3, DiskCache(CACHE_DIR / "bundle", BUNDLE_CACHE_MAX_MB * 1024 * 1024))
+bundles = OrgBundleBuilder(s3, manifests)
+image_proxy = ImageProxy(s3, DiskCache(CACHE_DIR / "img", IMAGE_CACHE_MAX_MB * 1024 * 1024))
+
+telemetry_ingestor = (
+    TelemetryIngestor(s3, max_pending_bytes=TELEMETRY_INGEST_MAX_MB * 1024 * 1024)
+    if TELEMETRY_INGEST else None
+)
 
 
 def _bucket_root_template() -> str:
@@ -76,6 +140,33 @@ class SitesPayload(BaseModel):
     sites_json: Dict[str, Any]
 
 
+class SiteOp(BaseModel):
+    op: str
+    id: Optional[str] = None
+    site: Optional[Dict[str, Any]] = None
+
+
+class SitesPatch(BaseModel):
+    ops: List[SiteOp] = Field(..., min_length=1, max_length=1000)
+
+
+class CleanupInput(BaseModel):
+    scope: str = Field(..., pattern="^(telemetry|org)$")
+    confirm: Optional[str] = None
+
+
+class TelemetryBatch(BaseModel):
+    userId: str = Field(..., min_length=1)
+    appVersion: Optional[str] = None
+    events: List[Dict[str, Any]] = Field(..., max_length=1000)
+
+
+class PresignInput(BaseModel):
+    keys: List[str] = Field(..., min_length=1, max_length=1000)
+    method: str = Field("get", pattern="^(get|put)$")
+    expires_in: int = Field(3600, ge=60, le=43200)
+
+
 class UsersJson(BaseModel):
     bucket_root: str
     org: str
@@ -86,6 +177,36 @@ class UsersJson(BaseModel):
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match lists etag (or is `*`)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {t.strip()[2:] if t.strip().startswith("W/") else t.strip() for t in header.split(",")}
+    return etag in tags
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def _conditional_json(request: Request, payload: Any, etag: Optional[str] = None) -> Response:
+    """JSON response carrying an ETag, or 304 if the client already has it.
+
+    Without an etag (no S3 object backs the body) one is derived from the
+    rendered body. `no-cache` makes browsers revalidate on every fetch.
+    """
+    response = JSONResponse(content=payload)
+    etag = etag or '"{}"'.format(hashlib.sha256(response.body).hexdigest()[:32])
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 def _normalize_username(name: str) -> str:
     return name.strip().lower()
 
@@ -187,7 +308,7 @@ def _user_pool_id() -> str:
 
 
 def _identity_pool_role_arn(identity_pool_id: str, region: str) -> str:
-    resp = boto3.client("cognito-identity", region_name=region).get_identity_pool_roles(
+    resp = cognito_client("cognito-identity", region_name=region).get_identity_pool_roles(
         IdentityPoolId=identity_pool_id
     )
     role_arn = resp.get("Roles", {}).get("authenticated", "")
@@ -475,23 +596,55 @@ def config():
     }
 
 
+@app.get("/api/cognito/throttle")
+def cognito_throttle_stats():
+    return cognito_throttle.stats()
+
+
 @app.get("/api/orgs")
-def list_orgs():
-    return {"orgs": s3.list_orgs()}
+def list_orgs(request: Request):
+    return _conditional_json(request, {"orgs": s3.list_orgs()})
 
 
 @app.get("/api/users")
-def list_all_users():
-    users = cognito.list_users(_user_pool_id())
-    return {"users": users}
+def list_all_users(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    field: str = "username",
+):
+    """All users, or with limit/cursor/q one page of them from Cognito.
+
+    A page response carries next_cursor (null on the last page); pass it back
+    with the same q and field to continue.
+    """
+    if limit is None and not cursor and not q:
+        users = cognito.list_users(_user_pool_id())
+        return _conditional_json(request, {"users": users})
+    if limit is None:
+        limit = MAX_USERS_PAGE
+    if limit < 1 or limit > MAX_USERS_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_USERS_PAGE}")
+    if field not in USER_SEARCH_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be one of {', '.join(USER_SEARCH_FIELDS)}")
+    try:
+        users, next_cursor = cognito.list_users_page(
+            _user_pool_id(), limit=limit, cursor=cursor, q=(q or "").strip() or None, field=field
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") == "InvalidParameterException":
+            raise HTTPException(status_code=400, detail=e.response["Error"].get("Message") or "Invalid cursor")
+        raise
+    return _conditional_json(request, {"users": users, "next_cursor": next_cursor})
 
 
 @app.get("/api/orgs/{org}/users")
-def list_org_users(org: str):
+def list_org_users(org: str, request: Request):
     all_users = cognito.list_users(_user_pool_id())
     users_json = s3.get_users_json(org)
     if not users_json:
-        return {"org": org, "users": []}
+        return _conditional_json(request, {"org": org, "users": []})
 
     mapped = []
     for u in users_json.get("users", []):
@@ -505,7 +658,7 @@ def list_org_users(org: str):
                 break
         mapped.append({"profile": u, "cognito": match})
 
-    return {"org": org, "users": mapped}
+    return _conditional_json(request, {"org": org, "users": mapped})
 
 
 @app.post("/api/orgs/{org}/users")
@@ -539,68 +692,93 @@ def add_user(org: str, payload: UserInput):
             raise HTTPException(status_code=400, detail=f"{code}: {message}")
         raise HTTPException(status_code=400, detail=str(e))
 
-    users_json = s3.get_users_json(org)
-    if not users_json:
-        users_json = {
-            "bucket_root": f"https://{BUCKET_NAME}.s3.amazonaws.com/{org}/",
-            "org": org,
-            "users": [],
-            "updated_at": _now_iso(),
-        }
-
-    entry = {
+    users_writer.upsert(org, [{
         "name": payload.name,
         "email": payload.email,
         "username": username.lower(),
         "password": payload.password,
-    }
-
-    users_json["users"] = [
-        u for u in users_json["users"] if (u.get("username") or "").lower() != entry["username"]
-    ]
-    users_json["users"].append(entry)
-    users_json["updated_at"] = _now_iso()
-    s3.put_users_json(org, users_json)
+    }])
 
     return {"ok": True, "created": created}
 
 
-@app.delete("/api/orgs/{org}/users/{username}")
-def delete_user(org: str, username: str):
-    cognito.delete_user(_user_pool_id(), username)
+def _run_user_import(job_id: str, org: str, user_pool_id: str, rows: List[Dict[str, str]]) -> None:
+    jobs.update(job_id, status="running")
 
-    users_json = s3.get_users_json(org)
-    if users_json:
-        users_json["users"] = [
-            u
-            for u in users_json.get("users", [])
-            if (u.get("username") or "").lower() != username.lower()
+    def _progress(counts: Dict[str, int]) -> None:
+        jobs.update(job_id, **counts)
+
+    try:
+        results = user_importer.run(user_pool_id, rows, progress=_progress)
+        # One result per row, in order: pair them so users.json gets the row
+        # Cognito imported, not a later duplicate that was rejected.
+        entries = [
+            {
+                "name": row["name"],
+                "email": row["email"],
+                "username": result["username"],
+                "password": row["password"],
+            }
+            for row, result in zip(rows, results)
+            if result["status"] != "failed"
         ]
-        users_json["updated_at"] = _now_iso()
-        s3.put_users_json(org, users_json)
+        if entries:
+            s3.ensure_org_prefix(org)
+            users_writer.upsert(org, entries)
+    except Exception as e:
+        jobs.update(job_id, status="failed", error=str(e))
+        return
+    counts = {k: sum(1 for r in results if r["status"] == k) for k in ("created", "updated", "failed")}
+    jobs.update(job_id, status="succeeded", results=results, **counts)
+
+
+@app.post("/api/orgs/{org}/users/import", status_code=202)
+def import_users(org: str, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+    """Bulk create/update users from a CSV or JSON file as a background job."""
+    try:
+        rows = parse_user_rows(file.filename or "", file.file.read())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not rows:
+        raise HTTPException(status_code=400, detail="No users in file")
+    if len(rows) > 5000:
+        raise HTTPException(status_code=400, detail="At most 5000 users per import")
+    for row in rows:
+        if row.get("name"):
+            row["username"] = _normalize_username(row["name"])
+    # Resolve the pool first: a missing auth config is a 400 with no job left
+    # behind in the registry.
+    user_pool_id = _user_pool_id()
+    job = jobs.create("user_import", org, total=len(rows), created=0, updated=0, failed=0, results=[])
+    background_tasks.add_task(_run_user_import, job["id"], org, user_pool_id, rows)
+    return job
 
+
+@app.delete("/api/orgs/{org}/users/{username}")
+def delete_user(org: str, username: str):
+    cognito.delete_user(_user_pool_id(), username)
+    users_writer.delete(org, username)
     return {"ok": True}
 
 
 @app.put("/api/orgs/{org}/users/{username}/password")
 def update_password(org: str, username: str, payload: PasswordInput):
     cognito.update_password(_user_pool_id(), username, payload.password)
-    users_json = s3.get_users_json(org)
-    if users_json:
-        for u in users_json.get("users", []):
-            if (u.get("username") or "").lower() == username.lower():
-                u["password"] = payload.password
-        users_json["updated_at"] = _now_iso()
-        s3.put_users_json(org, users_json)
+    users_writer.set_password(org, username, payload.password)
     return {"ok": True}
 
 
 @app.get("/api/auth_config")
-def get_auth_config():
-    existing = _get_auth_config_from_bucket()
-    if existing:
-        return existing
-    raise HTTPException(status_code=404, detail="auth_config.json not found in bucket.")
+def get_auth_config(request: Request):
+    if request.headers.get("if-none-match"):
+        etag = s3.head_etag(AUTH_CONFIG_KEY)
+        if etag and _etag_matches(request, etag):
+            return _not_modified(etag)
+    obj = s3.get_object_bytes(AUTH_CONFIG_KEY)
+    if obj is None:
+        raise HTTPException(status_code=404, detail="auth_config.json not found in bucket.")
+    body, etag = obj
+    return _conditional_json(request, json.loads(body.decode("utf-8")), etag)
 
 
 @app.post("/api/auth_config/sync")
@@ -661,22 +839,108 @@ def get_password_policy():
 
 
 @app.get("/api/orgs/{org}/sites")
-def get_sites(org: str):
-    sites = s3.get_sites_json(org)
+def get_sites(org: str, request: Request, since_version: Optional[int] = None):
+    if since_version is not None and since_version < 0:
+        raise HTTPException(status_code=400, detail="since_version must be >= 0")
+    # The body is a function of the sites.json object (and since_version),
+    # so its S3 ETag answers a revalidation with just a HEAD.
+    suffix = "" if since_version is None else f"-since{since_version}"
+    if request.headers.get("if-none-match"):
+        etag = s3.head_etag(f"{org}/sites.json")
+        if etag and _etag_matches(request, '"{}{}"'.format(etag.strip('"'), suffix)):
+            return _not_modified('"{}{}"'.format(etag.strip('"'), suffix))
+    sites, sites_etag, index = sites_store.read(org)
     if sites is None:
+        if since_version is not None:
+            raise HTTPException(status_code=404, detail="sites.json not found")
         return {"org": org, "sites_json": None}
-    return {"org": org, "sites_json": sites}
+    etag = '"{}{}"'.format(sites_etag.strip('"'), suffix)
+    if since_version is not None:
+        return _conditional_json(request, sites_store.delta(org, sites, index, since_version), etag)
+    version = index["version"] if index else 0
+    return _conditional_json(request, {"org": org, "sites_json": sites, "version": version}, etag)
+
+
+def _require_site_ids(sites_json: Dict[str, Any]) -> None:
+    missing = sites_missing_ids(sites_json)
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Every site needs an id; missing at positions {missing[:10]}",
+        )
 
 
 @app.put("/api/orgs/{org}/sites")
-def put_sites(org: str, payload: SitesPayload):
+def put_sites(org: str, payload: SitesPayload, background_tasks: BackgroundTasks):
+    _require_site_ids(payload.sites_json)
     s3.ensure_org_prefix(org)
     s3.put_sites_json(org, payload.sites_json)
+    sites_store.commit(org)
+    nearby_sites.invalidate(org)
+    background_tasks.add_task(site_tiles.publish, org)
+    background_tasks.add_task(bundles.request_rebuild, org)
     return {"ok": True}
 
 
+@app.get("/api/orgs/{org}/sites/nearby")
+def get_nearby_sites(org: str, lat: float, lng: float, k: int = 5, radius: Optional[float] = None):
+    """The k sites closest to (lat, lng), optionally within radius metres."""
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="lat must be in [-90, 90] and lng in [-180, 180]")
+    if k < 1 or k > 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+    if radius is not None and radius <= 0:
+        raise HTTPException(status_code=400, detail="radius must be > 0")
+    index = nearby_sites.get(org)
+    if index is None:
+        raise HTTPException(status_code=404, detail="sites.json not found")
+    return {
+        "org": org,
+        "lat": lat,
+        "lng": lng,
+        "sites": [
+            {"distance_m": round(distance, 1), "site": site}
+            for distance, site in index.nearest(lat, lng, k, radius)
+        ],
+    }
+
+
+@app.get("/api/orgs/{org}/sites/tiles")
+def get_site_tiles(org: str, lat: Optional[float] = None, lng: Optional[float] = None):
+    """Tile index for org's sites; with lat/lng, also the tiles around that point."""
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be given together")
+    if lat is not None and not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail="lat must be in [-90, 90] and lng in [-180, 180]")
+    index = site_tiles.ensure_fresh(org)
+    if index is None:
+        raise HTTPException(status_code=404, detail="sites.json not found")
+    out = {k: index[k] for k in ("org", "precision", "source_etag", "generated_at", "tiles")}
+    if lat is not None:
+        out["near"] = site_tiles.near(index, lat, lng)
+    return out
+
+
+@app.patch("/api/orgs/{org}/sites")
+def patch_sites(org: str, payload: SitesPatch, background_tasks: BackgroundTasks):
+    """Apply site-level add/upsert/update/delete ops with an ETag-conditional write."""
+    ops = [op.model_dump(exclude_none=True) for op in payload.ops]
+    try:
+        result = sites_store.patch(org, ops)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="sites.json kept changing; retry the patch")
+    nearby_sites.invalidate(org)
+    background_tasks.add_task(site_tiles.publish, org)
+    background_tasks.add_task(bundles.request_rebuild, org)
+    return {"ok": True, **result}
+
+
 @app.post("/api/orgs/{org}/sites/upload")
-def upload_sites(org: str, file: UploadFile = File(...)):
+def upload_sites(org: str, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     if not file.filename.endswith(".json"):
         raise HTTPException(status_code=400, detail="sites.json upload must be a .json file")
     content = file.file.read()
@@ -684,14 +948,22 @@ def upload_sites(org: str, file: UploadFile = File(...)):
         sites_data = json.loads(content.decode("utf-8"))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+    if not isinstance(sites_data, dict):
+        raise HTTPException(status_code=400, detail="sites.json must be a JSON object")
+    _require_site_ids(sites_data)
     s3.ensure_org_prefix(org)
     s3.put_sites_json(org, sites_data)
+    sites_store.commit(org)
+    nearby_sites.invalidate(org)
+    background_tasks.add_task(site_tiles.publish, org)
+    background_tasks.add_task(bundles.request_rebuild, org)
     return {"ok": True}
 
 
 @app.post("/api/orgs/{org}/ghosts")
 def upload_ghost_image(
     org: str,
+    background_tasks: BackgroundTasks,
     site_id: str = Form(...),
     orientation: str = Form(...),
     image: UploadFile = File(...),
@@ -700,22 +972,24 @@ def upload_ghost_image(
         raise HTTPException(status_code=400, detail="site_id is required")
     if orientation not in ("portrait", "landscape"):
         raise HTTPException(status_code=400, detail="orientation must be portrait or landscape")
-    content = image.file.read()
     original = image.filename or "image"
     stem, dot, ext = original.rpartition(".")
     ext = f".{ext}" if dot else ""
     stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
     base = _sanitize_filename(stem or "image")
-    prefix = f"{org}/{site_id}/"
-    existing = set(s3.list_keys(prefix))
-    index = 1
-    while True:
-        candidate = f"{stamp}-{base}-{index}{ext}"
-        key = f"{prefix}{candidate}"
-        if key not in existing:
-            break
-        index += 1
-    s3.upload_ghost_image(org, site_id, candidate, content, content_type=image.content_type)
+    info = describe_image(image.file)
+    candidate = ghost_catalog.reserve(org, site_id, stamp, base, ext)
+    key = f"{org}/{site_id}/{candidate}"
+    try:
+        # image.file is spooled to disk by the multipart parser; hand it to S3 as a
+        # stream rather than reading the whole original into memory.
+        s3.upload_ghost_image(org, site_id, candidate, image.file, content_type=image.content_type)
+    except Exception:
+        ghost_catalog.release(org, site_id, candidate)
+        raise
+    ghost_catalog.record(org, site_id, candidate, orientation, info, image.content_type)
+    background_tasks.add_task(_build_ghost_variants, org, f"{site_id}/{candidate}")
+    background_tasks.add_task(bundles.request_rebuild, org)
     return {
         "ok": True,
         "key": key,
@@ -723,6 +997,115 @@ def upload_ghost_image(
     }
 
 
+@app.get("/api/orgs/{org}/sites/{site_id}/ghosts")
+def list_site_ghosts(org: str, site_id: str):
+    """Reference images uploaded for a site, from its ghosts.json catalog."""
+    return ghost_catalog.get(org, site_id)
+
+
+def _build_ghost_variants(org: str, relative_path: str) -> None:
+    try:
+        ghost_variants.build_and_record(org, relative_path)
+    except Exception:
+        # Variants are an optimisation; the original stays usable and a
+        # backfill can regenerate them.
+        logger.exception("Building ghost variants for %s/%s failed", org, relative_path)
+
+
+def _run_variant_backfill(job_id: str, org: str, force: bool) -> None:
+    jobs.update(job_id, status="running")
+    try:
+        paths = reference_paths(s3.get_sites_json(org))
+        result = ghost_variants.backfill(
+            org, paths, force=force, progress=lambda p: jobs.update(job_id, **p)
+        )
+    except Exception as e:
+        jobs.update(job_id, status="failed", error=str(e))
+        return
+    jobs.update(
+        job_id,
+        status="failed" if result["failed"] else "succeeded",
+        done=result["built"],
+        failed=result["failed"],
+        skipped=result["skipped"],
+        total=result["built"] + result["failed"] + result["skipped"],
+        errors=result["errors"],
+    )
+
+
+@app.post("/api/orgs/{org}/ghosts/variants", status_code=202)
+def backfill_ghost_variants(org: str, background_tasks: BackgroundTasks, force: bool = False):
+    """Generate mobile variants for every reference image named in sites.json."""
+    job = jobs.create("ghost_variants", org, done=0, failed=0, skipped=0, total=None, errors=[])
+    background_tasks.add_task(_run_variant_backfill, job["id"], org, force)
+    return job
+
+
+@app.get("/api/orgs/{org}/ghosts/variants")
+def get_ghost_variants(org: str):
+    index = s3.get_ghost_variants_json(org)
+    return {"org": org, "images": (index or {}).get("images", {})}
+
+
+@app.get("/api/orgs/{org}/manifest")
+def get_manifest(org: str, since: int = 0):
+    """Content hashes of sites.json and referenced ghosts changed after version `since`."""
+    if since < 0:
+        raise HTTPException(status_code=400, detail="since must be >= 0")
+    manifest = manifests.ensure_fresh(org)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="sites.json not found")
+    return manifests.delta(manifest, since)
+
+
+@app.get("/api/orgs/{org}/bundle")
+def get_bundle(org: str, background_tasks: BackgroundTasks):
+    """Latest offline bundle for org with a presigned download URL.
+
+    If sites.json moved on since it was built (phones write it directly), a
+    rebuild is started and the response says the bundle is stale.
+    """
+    latest = bundles.get_latest(org)
+    if not latest:
+        raise HTTPException(status_code=404, detail="No bundle has been built for this org yet.")
+    stale = bundles.is_stale(org, latest)
+    if stale:
+        background_tasks.add_task(bundles.request_rebuild, org)
+    url, expires_at = s3.presign([latest["key"]])[latest["key"]]
+    return {
+        "org": org,
+        "version": latest["version"],
+        "bytes": latest["bytes"],
+        "sha256": latest["sha256"],
+        "built_at": latest["built_at"],
+        "url": url,
+        "files": {p: {"sha256": f["sha256"], "bytes": f["bytes"]} for p, f in latest["files"].items()},
+        "missing": latest.get("missing", []),
+        "stale": stale,
+    }
+
+
+def _run_bundle_build(job_id: str, org: str) -> None:
+    jobs.update(job_id, status="running")
+    try:
+        latest = bundles.rebuild(org, force=True)
+    except Exception as e:
+        jobs.update(job_id, status="failed", error=str(e))
+        return
+    if latest is None:
+        jobs.update(job_id, status="failed", error="sites.json not found")
+        return
+    jobs.update(job_id, status="succeeded", version=latest["version"], bytes=latest["bytes"])
+
+
+@app.post("/api/orgs/{org}/bundle", status_code=202)
+def build_bundle(org: str, background_tasks: BackgroundTasks):
+    """Force a full bundle rebuild as a background job."""
+    job = jobs.create("bundle", org, version=None, bytes=None)
+    background_tasks.add_task(_run_bundle_build, job["id"], org)
+    return job
+
+
 @app.post("/api/orgs/{org}/provision")
 def provision_org(org: str, bucket: Optional[str] = None):
     """Ensure org prefix, telemetry/{org}/ prefix, and the telemetry lifecycle rule exist.
@@ -755,6 +1138,60 @@ def get_telemetry(org: str, days: int = 7):
     return result
 
 
+@app.post("/api/orgs/{org}/telemetry", status_code=202)
+def ingest_telemetry(org: str, payload: TelemetryBatch):
+    """Buffer a device's telemetry batch for coalesced hourly NDJSON writes.
+
+    Only available when the server runs with TELEMETRY_INGEST=1.
+    """
+    if not telemetry_ingestor:
+        raise HTTPException(status_code=404, detail="Telemetry ingestion is not enabled on this server.")
+    accepted = telemetry_ingestor.add(org, payload.userId, payload.appVersion, payload.events)
+    return {"ok": True, "accepted": accepted}
+
+
+@app.get("/api/orgs/{org}/telemetry/events")
+def stream_telemetry(
+    org: str,
+    days: int = 7,
+    limit: int = 200,
+    cursor: Optional[str] = None,
+    level: Optional[str] = None,
+    pivot: Optional[str] = None,
+    user: Optional[str] = None,
+):
+    """Stream one page of telemetry events for org as NDJSON, newest first.
+
+    Each line is one event. The final line is {"next_cursor": ...}; pass it
+    back as `cursor` to fetch the next page, null when history is exhausted.
+    """
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if cursor:
+        try:
+            decode_telemetry_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def _lines():
+        events = s3.iter_telemetry_events(
+            org, days=days, level=level, pivot=pivot, user=user, cursor=cursor
+        )
+        last_cursor = None
+        sent = 0
+        for event, event_cursor in events:
+            if sent == limit:
+                break
+            yield json.dumps(event) + "\n"
+            last_cursor = event_cursor
+            sent += 1
+        else:
+            last_cursor = None
+        yield json.dumps({"next_cursor": last_cursor}) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+
 @app.delete("/api/orgs/{org}/telemetry")
 def delete_telemetry(org: str):
     """Delete all telemetry objects for the given org under telemetry/{org}/."""
@@ -762,15 +1199,111 @@ def delete_telemetry(org: str):
     return {"ok": True, "deleted": count}
 
 
+def _run_cleanup(job_id: str, org: str, scope: str) -> None:
+    jobs.update(job_id, status="running")
+
+    def _progress(totals: Dict[str, Any]) -> None:
+        jobs.update(job_id, deleted=totals["deleted"], failed=totals["failed"])
+
+    try:
+        if scope == "org":
+            result = s3.delete_org(org, progress=_progress)
+        else:
+            prefix = f"telemetry/{org}/"
+            result = s3.delete_prefix(prefix, keep={prefix}, progress=_progress)
+    except Exception as e:
+        jobs.update(job_id, status="failed", error=str(e))
+        return
+    jobs.update(
+        job_id,
+        status="failed" if result["failed"] else "succeeded",
+        deleted=result["deleted"],
+        failed=result["failed"],
+        errors=result["errors"],
+    )
+
+
+@app.post("/api/orgs/{org}/cleanup", status_code=202)
+def start_cleanup(org: str, payload: CleanupInput, background_tasks: BackgroundTasks):
+    """Start a background delete of telemetry/{org}/ or of the whole org.
+
+    scope=org removes {org}/ and telemetry/{org}/ entirely and requires
+    `confirm` to equal the org name.
+    """
+    if payload.scope == "org" and payload.confirm != org:
+        raise HTTPException(status_code=400, detail="confirm must equal the org name to delete an org")
+    job = jobs.create(f"cleanup:{payload.scope}", org, deleted=0, failed=0, errors=[])
+    background_tasks.add_task(_run_cleanup, job["id"], org, payload.scope)
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
 @app.get("/api/s3")
 def presign_s3(key: str):
     if not key:
         raise HTTPException(status_code=400, detail="key is required")
     if key.startswith("/"):
         key = key[1:]
-    url = s3.s3.generate_presigned_url(
-        "get_object",
-        Params={"Bucket": BUCKET_NAME, "Key": key},
-        ExpiresIn=3600,
-    )
+    url, _ = s3.presign([key])[key]
     return RedirectResponse(url)
+
+
+@app.get("/api/img/{key:path}")
+def resized_image(key: str, request: Request, w: int = 320):
+    """Serve a JPEG of an S3 image downscaled to about `w` px wide.
+
+    Widths are rounded up to a fixed set of buckets. Renditions are cached
+    on local disk by ETag + width; responses carry a long max-age and an
+    ETag so browsers revalidate with a 304.
+    """
+    if w < 1 or w > 4096:
+        raise HTTPException(status_code=400, detail="w must be between 1 and 4096")
+    width = snap_width(w)
+    try:
+        etag = image_proxy.etag(key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+            raise HTTPException(status_code=404, detail="image not found")
+        raise
+    response_etag = '"{}-w{}"'.format(etag.strip('"'), width)
+    headers = {"ETag": response_etag, "Cache-Control": "private, max-age=604800"}
+    if _etag_matches(request, response_etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        body, info = image_proxy.get(key, width, etag)
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=415, detail=f"Could not resize image: {e}")
+    except ClientError as e:
+        # Deleted between the HEAD and the GET.
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+            raise HTTPException(status_code=404, detail="image not found")
+        raise
+    headers["X-Cache"] = info["cache"]
+    return Response(content=body, media_type="image/jpeg", headers=headers)
+
+
+@app.post("/api/s3/presign")
+def presign_s3_batch(payload: PresignInput):
+    """Presign many keys in one call for GET (default) or PUT."""
+    client_method = "put_object" if payload.method == "put" else "get_object"
+    keys = [k[1:] if k.startswith("/") else k for k in payload.keys]
+    signed = s3.presign(keys, client_method=client_method, expires_in=payload.expires_in)
+    return {
+        "method": payload.method,
+        "urls": {
+            key: {
+                "url": url,
+                "expires_at": datetime.fromtimestamp(expires_at, timezone.utc)
+                .isoformat()
+                .replace("+00:00", "Z"),
+            }
+            for key, (url, expires_at) in signed.items()
+        },
+    }
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .disk_cache import DiskCache
+from .ghost_variants import reference_paths
+from .s3_service import S3Service
+
+# Deleted paths are remembered for this many entries. A client whose `since`
+# predates the oldest forgotten deletion is told to resync from scratch.
+MAX_DELETED = 5000
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class OrgManifest:
+    """Content-hash index of what a device syncs for an org, at {org}/manifest.json.
+
+    Covers sites.json and every reference image it names:
+
+        {"org", "version", "updated_at",
+         "files": {path: {sha256, bytes, etag, version}},
+         "deleted": {path: version}, "deleted_floor", "missing": [path]}
+
+    `version` increases by one on each refresh that changes anything, and each
+    file carries the version at which its content last changed, so a client
+    holding version N asks for everything newer than N. Hashes are only
+    recomputed for objects whose ETag moved; bytes come through a local cache
+    keyed by ETag, which the bundle builder reads from as well.
+    """
+
+    def __init__(self, s3: S3Service, cache: DiskCache):
+        self.s3 = s3
+        self.cache = cache
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    def get(self, org: str) -> Optional[Dict[str, Any]]:
+        return self.s3.get_manifest_json(org)
+
+    def ensure_fresh(self, org: str) -> Optional[Dict[str, Any]]:
+        """Return the manifest, refreshing first if sites.json moved on.
+
+        Phones write sites.json directly when they promote local sites, so a
+        manifest only refreshed after admin writes would miss their changes.
+        """
+        manifest = self.get(org)
+        etag = self.s3.head_etag(f"{org}/sites.json")
+        if etag is None:
+            return None
+        if manifest and manifest["files"].get("sites.json", {}).get("etag") == etag:
+            return manifest
+        return self.refresh(org)
+
+    def refresh(self, org: str) -> Optional[Dict[str, Any]]:
+        """Bring the manifest in line with S3 and return it (None without sites.json)."""
+        with self._locks_guard:
+            lock = self._locks[org]
+        with lock:
+            return self._refresh(org)
+
+    def _refresh(self, org: str) -> Optional[Dict[str, Any]]:
+        sites_obj = self.s3.get_object_bytes(f"{org}/sites.json")
+        if sites_obj is None:
+            return None
+        sites_body, sites_etag = sites_obj
+        sites_json = json.loads(sites_body.decode("utf-8"))
+
+        manifest = self.get(org) or {
+            "org": org, "version": 0, "files": {}, "deleted": {}, "deleted_floor": 0, "missing": [],
+        }
+        old_files = manifest["files"]
+        version = int(manifest["version"]) + 1
+
+        current: Dict[str, Dict[str, Any]] = {
+            "sites.json": {
+                "etag": sites_etag,
+                "sha256": hashlib.sha256(sites_body).hexdigest(),
+                "bytes": len(sites_body),
+            }
+        }
+        missing = []
+        for path in reference_paths(sites_json):
+            etag = self.s3.head_etag(f"{org}/{path}")
+            if etag is None:
+                missing.append(path)
+                continue
+            old = old_files.get(path)
+            if old and old.get("etag") == etag:
+                current[path] = old
+                continue
+            body = self.object_bytes(f"{org}/{path}", etag)
+            current[path] = {
+                "etag": etag,
+                "sha256": hashlib.sha256(body).hexdigest(),
+                "bytes": len(body),
+            }
+
+        changed = False
+        files: Dict[str, Dict[str, Any]] = {}
+        for path, entry in current.items():
+            old = old_files.get(path)
+            if old and old.get("sha256") == entry["sha256"]:
+                # Same content (possibly re-uploaded): keep its version.
+                files[path] = {**entry, "version": old["version"]}
+                changed = changed or old.get("etag") != entry["etag"]
+            else:
+                files[path] = {**entry, "version": version}
+                changed = True
+
+        deleted = dict(manifest.get("deleted", {}))
+        for path in old_files:
+            if path not in files:
+                deleted[path] = version
+                changed = True
+        for path in files:
+            if deleted.pop(path, None) is not None:
+                changed = True
+        floor = int(manifest.get("deleted_floor", 0))
+        if len(deleted) > MAX_DELETED:
+            for path, v in sorted(deleted.items(), key=lambda kv: kv[1])[: len(deleted) - MAX_DELETED]:
+                floor = max(floor, v)
+                del deleted[path]
+
+        if missing != manifest.get("missing", []):
+            changed = True
+        if not changed:
+            return manifest
+
+        # An ETag-only change (same bytes re-uploaded) is saved without a new
+        # version, since no client needs to download anything.
+        bumped = any(f["version"] == version for f in files.values()) or any(
+            v == version for v in deleted.values()
+        )
+        manifest = {
+            "org": org,
+            "version": version if bumped else int(manifest["version"]),
+            "updated_at": _now_iso(),
+            "files": files,
+            "deleted": deleted,
+            "deleted_floor": floor,
+            "missing": missing,
+        }
+        self.s3.put_manifest_json(org, manifest)
+        return manifest
+
+    def delta(self, manifest: Dict[str, Any], since: int) -> Dict[str, Any]:
+        """Files changed and paths deleted after version `since`.
+
+        `reset` is true when deletions the client may have missed were already
+        forgotten; the client should then drop anything not listed in `files`.
+        """
+        reset = since < int(manifest.get("deleted_floor", 0))
+        if reset:
+            since = 0
+        return {
+            "org": manifest["org"],
+            "version": manifest["version"],
+            "since": since,
+            "reset": reset,
+            "files": {
+                path: {"sha256": f["sha256"], "bytes": f["bytes"], "version": f["version"]}
+                for path, f in manifest["files"].items()
+                if f["version"] > since
+            },
+            "deleted": sorted(p for p, v in manifest.get("deleted", {}).items() if v > since),
+            "missing": manifest.get("missing", []),
+        }
+
+    def object_bytes(self, key: str, etag: str) -> bytes:
+        body = self.cache.get(key, etag)
+        if body is not None:
+            return body
+        resp = self.s3.s3.get_object(Bucket=self.s3.bucket_name, Key=key)
+        body = resp["Body"].read()
+        self.cache.put(key, resp.get("ETag", etag), body)
+        return body
@@ -0,0 +1,40 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved.
+
+    acquire() blocks until a token is available, so a pool of workers sharing
+    a bucket never exceeds `rate` calls per second on average.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float, burst: float = 1.0) -> None:
+        """Change rate and burst; tokens saved beyond the new burst are dropped."""
+        if rate <= 0:
+            raise ValueError("rate must be > 0")
+        with self._lock:
+            self.rate = rate
+            self.burst = max(1.0, burst)
+            self._tokens = min(self._tokens, self.burst)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
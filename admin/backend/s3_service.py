@@ -1,16 +1,93 @@
+import base64
+import io
 import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timezone, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, BinaryIO, Callable, Iterable, Iterator, Optional, Set, Tuple, Union
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
+from .disk_cache import DiskCache
+
+
+def encode_telemetry_cursor(position: Dict[str, Any]) -> str:
+    """Pack a telemetry stream position into an opaque, URL-safe token."""
+    raw = json.dumps(position, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_telemetry_cursor(token: str) -> Dict[str, Any]:
+    """Inverse of encode_telemetry_cursor. Raises ValueError on a bad token."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return {
+            "d": str(position["d"]),
+            "t": int(position["t"]),
+            "k": str(position["k"]),
+            "i": int(position["i"]),
+        }
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def _telemetry_key_epoch_ms(key: str) -> int:
+    """Extract epochMs from telemetry/{org}/{date}/{userId}_{epochMs}.json."""
+    stem = key.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    _, _, epoch = stem.rpartition("_")
+    try:
+        return int(epoch)
+    except ValueError:
+        return 0
+
+
+def _parse_telemetry_body(key: str, body: bytes) -> List[Dict[str, Any]]:
+    """Return the events in a telemetry object with _userId/_appVersion attached.
+
+    Phones write one JSON envelope per flush ({userId, appVersion, events});
+    the ingestion endpoint writes .ndjson with those fields already on each line.
+    """
+    text = body.decode("utf-8")
+    if key.endswith(".ndjson"):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    data = json.loads(text)
+    events = data.get("events", [])
+    for event in events:
+        event["_userId"] = data.get("userId")
+        event["_appVersion"] = data.get("appVersion")
+    return events
+
+
+# Uploads above 8 MB go multipart in 8 MB parts, 4 parts in flight, so a
+# full-resolution original never costs more than ~32 MB of buffers.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+)
+
+
+class WriteConflict(Exception):
+    """A conditional write lost to a concurrent writer (HTTP 412/409 from S3)."""
+
 
 class S3Service:
-    def __init__(self, bucket_name: str, region: str):
+    def __init__(self, bucket_name: str, region: str, cache: Optional[DiskCache] = None):
         self.bucket_name = bucket_name
         self.region = region
-        self.s3 = boto3.client("s3", region_name=region)
+        self._session = boto3.session.Session()
+        self.s3 = self._session.client("s3", region_name=region)
+        # Telemetry objects are never rewritten once flushed, so reads can be
+        # served from a local cache keyed by object key + ETag.
+        self.cache = cache
+        # (access_key, client_method, key, expires_in) -> (url, expires_at epoch seconds)
+        self._presigned: Dict[Tuple[str, str, str, int], Tuple[str, float]] = {}
+        self._presigned_lock = threading.Lock()
 
     def list_orgs(self) -> List[str]:
         resp = self.s3.list_objects_v2(
@@ -25,8 +102,7 @@ class S3Service:
         key = f"{org}/"
         self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=b"")
 
-    def get_users_json(self, org: str) -> Optional[Dict[str, Any]]:
-        key = f"{org}/users.json"
+    def _get_json(self, key: str) -> Optional[Dict[str, Any]]:
         try:
             resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
             body = resp["Body"].read().decode("utf-8")
@@ -38,9 +114,8 @@ class S3Service:
                 return None
             raise
 
-    def put_users_json(self, org: str, users_data: Dict[str, Any]) -> None:
-        key = f"{org}/users.json"
-        body = json.dumps(users_data, indent=2)
+    def _put_json(self, key: str, data: Dict[str, Any]) -> None:
+        body = json.dumps(data, indent=2)
         self.s3.put_object(
             Bucket=self.bucket_name,
             Key=key,
@@ -48,51 +123,175 @@ class S3Service:
             ContentType="application/json",
         )
 
-    def get_sites_json(self, org: str) -> Optional[Dict[str, Any]]:
-        key = f"{org}/sites.json"
+    def get_object_bytes(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Return (body, etag) for key, or None if it does not exist."""
         try:
             resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-            body = resp["Body"].read().decode("utf-8")
-            return json.loads(body)
         except self.s3.exceptions.NoSuchKey:
             return None
         except ClientError as e:
             if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
                 return None
             raise
+        return resp["Body"].read(), resp.get("ETag", "")
 
-    def put_sites_json(self, org: str, sites_data: Dict[str, Any]) -> None:
-        key = f"{org}/sites.json"
-        body = json.dumps(sites_data, indent=2)
-        self.s3.put_object(
-            Bucket=self.bucket_name,
-            Key=key,
-            Body=body.encode("utf-8"),
-            ContentType="application/json",
+    def put_json_if_match(self, key: str, data: Dict[str, Any], etag: Optional[str]) -> str:
+        """Write JSON only if key still has `etag` (or does not exist, if None).
+
+        Returns the new ETag. Raises WriteConflict if another writer got there
+        first; the caller re-reads and retries.
+        """
+        condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+        try:
+            resp = self.s3.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=json.dumps(data, indent=2).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise WriteConflict(key) from e
+            raise
+        return resp.get("ETag", "")
+
+    def upload_object(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> None:
+        """Stream a file-like object to key, multipart for large bodies."""
+        self.s3.upload_fileobj(
+            fileobj,
+            self.bucket_name,
+            key,
+            ExtraArgs={"ContentType": content_type} if content_type else None,
+            Config=TRANSFER_CONFIG,
         )
 
+    def head_etag(self, key: str) -> Optional[str]:
+        """Return the object's ETag, or None if it does not exist."""
+        try:
+            return self.s3.head_object(Bucket=self.bucket_name, Key=key).get("ETag")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+                return None
+            raise
+
+    def get_users_json(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/users.json")
+
+    def put_users_json(self, org: str, users_data: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/users.json", users_data)
+
+    def get_sites_json(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/sites.json")
+
+    def put_sites_json(self, org: str, sites_data: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/sites.json", sites_data)
+
+    def get_ghost_catalog(self, org: str, site_id: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/{site_id}/ghosts.json")
+
+    def put_ghost_catalog(self, org: str, site_id: str, catalog: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/{site_id}/ghosts.json", catalog)
+
+    def get_bundle_latest(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/bundles/latest.json")
+
+    def put_bundle_latest(self, org: str, latest: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/bundles/latest.json", latest)
+
+    def get_sites_index(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/sites_index.json")
+
+    def put_sites_index(self, org: str, index: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/sites_index.json", index)
+
+    def get_site_tiles_index(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/_tiles/index.json")
+
+    def put_site_tiles_index(self, org: str, index: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/_tiles/index.json", index)
+
+    def get_manifest_json(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/manifest.json")
+
+    def put_manifest_json(self, org: str, manifest: Dict[str, Any]) -> None:
+        self._put_json(f"{org}/manifest.json", manifest)
+
+    def get_ghost_variants_json(self, org: str) -> Optional[Dict[str, Any]]:
+        return self._get_json(f"{org}/ghost_variants.json")
+
     def upload_ghost_image(
         self,
         org: str,
         site_id: str,
         filename: str,
-        content: bytes,
+        content: Union[bytes, BinaryIO],
         content_type: str | None = None,
     ) -> str:
+        """Upload a reference image, streaming file-like content in multipart parts."""
         key = f"{org}/{site_id}/{filename}"
-        extra = {}
-        if content_type:
-            extra["ContentType"] = content_type
-        self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=content, **extra)
+        fileobj = io.BytesIO(content) if isinstance(content, bytes) else content
+        self.upload_object(key, fileobj, content_type=content_type)
         return key
 
+    def presign(
+        self,
+        keys: Iterable[str],
+        client_method: str = "get_object",
+        expires_in: int = 3600,
+        max_cached: int = 20_000,
+    ) -> Dict[str, Tuple[str, float]]:
+        """Presigned URLs for many keys: {key: (url, expires_at)}.
+
+        URLs are cached and handed out again until less than a quarter of
+        their lifetime remains. Besides saving signing work, returning the
+        same URL lets browsers reuse their HTTP cache for the image.
+
+        A URL stops working when the credentials that signed it expire, so
+        with temporary credentials (an instance or task role) expires_at is
+        capped at their expiry, and the cache is keyed by access key so a
+        rotation starts a fresh set of URLs.
+        """
+        now = time.time()
+        refresh_margin = expires_in / 4
+        credentials = self._session.get_credentials()
+        # Freezing refreshes credentials that are close to expiry first.
+        access_key = credentials.get_frozen_credentials().access_key if credentials else ""
+        # botocore keeps no public accessor for this; static keys have none.
+        expiry = getattr(credentials, "_expiry_time", None)
+        valid_until = now + expires_in
+        if expiry is not None:
+            valid_until = min(valid_until, expiry.timestamp())
+        out: Dict[str, Tuple[str, float]] = {}
+        with self._presigned_lock:
+            for key in keys:
+                cache_key = (access_key, client_method, key, expires_in)
+                hit = self._presigned.get(cache_key)
+                if hit and hit[1] - now > refresh_margin:
+                    out[key] = hit
+                    continue
+                url = self.s3.generate_presigned_url(
+                    client_method,
+                    Params={"Bucket": self.bucket_name, "Key": key},
+                    ExpiresIn=expires_in,
+                )
+                out[key] = self._presigned[cache_key] = (url, valid_until)
+            if len(self._presigned) > max_cached:
+                self._presigned = {
+                    k: v for k, v in self._presigned.items() if v[1] - now > refresh_margin
+                }
+        return out
+
     def list_keys(self, prefix: str) -> List[str]:
-        keys: List[str] = []
+        return [obj["Key"] for obj in self.list_objects(prefix)]
+
+    def list_objects(self, prefix: str) -> List[Dict[str, Any]]:
+        """List objects under prefix as raw list_objects_v2 entries (Key, ETag, Size, LastModified)."""
+        objects: List[Dict[str, Any]] = []
         paginator = self.s3.get_paginator("list_objects_v2")
         for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
-            for obj in page.get("Contents", []):
-                keys.append(obj["Key"])
-        return keys
+            objects.extend(page.get("Contents", []))
+        return objects
 
     def ensure_telemetry_prefix(self, org: str) -> None:
         """Create the telemetry/{org}/ placeholder key if it doesn't exist."""
@@ -152,25 +351,117 @@ class S3Service:
         )
         return {"created": True, "rules": [_summarise(r) for r in rules]}
 
-    def delete_telemetry(self, org: str) -> int:
+    def delete_telemetry(
+        self, org: str, progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> int:
         """Delete all telemetry objects for org under telemetry/{org}/.
 
         Skips the placeholder key (telemetry/{org}/ itself).
         Returns the count of objects deleted.
         """
         prefix = f"telemetry/{org}/"
-        keys = [k for k in self.list_keys(prefix) if k != prefix]
-        if not keys:
-            return 0
+        result = self.delete_prefix(prefix, keep={prefix}, progress=progress)
+        return result["deleted"]
+
+    def delete_org(
+        self, org: str, progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """Delete every object under {org}/ and telemetry/{org}/, placeholders included."""
+        totals = {"deleted": 0, "failed": 0, "errors": []}
+
+        def _report(done: Dict[str, Any]) -> None:
+            if progress:
+                progress({
+                    "deleted": totals["deleted"] + done["deleted"],
+                    "failed": totals["failed"] + done["failed"],
+                })
+
+        for prefix in (f"telemetry/{org}/", f"{org}/"):
+            result = self.delete_prefix(prefix, progress=_report)
+            totals["deleted"] += result["deleted"]
+            totals["failed"] += result["failed"]
+            totals["errors"].extend(result["errors"])
+        return totals
+
+    def delete_prefix(
+        self,
+        prefix: str,
+        keep: Iterable[str] = (),
+        workers: int = 4,
+        max_attempts: int = 5,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Delete every object under prefix while the listing is still running.
+
+        Each list_objects_v2 page (up to 1000 keys, the delete_objects limit)
+        is handed to a pool of `workers` threads as soon as it arrives, with at
+        most 2 * workers batches in flight so memory stays bounded. Keys that
+        come back in a batch's Errors are retried with jittered backoff up to
+        max_attempts. `progress` is called with running totals after each
+        batch.
+
+        Returns {deleted, failed, errors} where errors holds up to 100
+        {key, code, message} entries for keys that could not be deleted.
+        """
+        keep_keys: Set[str] = set(keep)
+        totals: Dict[str, Any] = {"deleted": 0, "failed": 0, "errors": []}
+        in_flight: Set[Future] = set()
+
+        def _collect(done: Iterable[Future]) -> None:
+            for fut in done:
+                deleted, errors = fut.result()
+                totals["deleted"] += deleted
+                totals["failed"] += len(errors)
+                room = 100 - len(totals["errors"])
+                totals["errors"].extend(errors[:max(room, 0)])
+                if progress:
+                    progress({"deleted": totals["deleted"], "failed": totals["failed"]})
+
+        paginator = self.s3.get_paginator("list_objects_v2")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                batch = [o["Key"] for o in page.get("Contents", []) if o["Key"] not in keep_keys]
+                if not batch:
+                    continue
+                if len(in_flight) >= 2 * workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _collect(done)
+                in_flight.add(pool.submit(self._delete_batch, batch, max_attempts))
+            done, _ = wait(in_flight)
+            _collect(done)
+        return totals
+
+    def _delete_batch(
+        self, keys: List[str], max_attempts: int
+    ) -> Tuple[int, List[Dict[str, str]]]:
+        """delete_objects one batch, retrying per-key failures. Returns (deleted, errors)."""
+        pending = keys
         deleted = 0
-        for i in range(0, len(keys), 1000):
-            batch = keys[i : i + 1000]
-            self.s3.delete_objects(
-                Bucket=self.bucket_name,
-                Delete={"Objects": [{"Key": k} for k in batch]},
-            )
-            deleted += len(batch)
-        return deleted
+        errors: List[Dict[str, str]] = []
+        for attempt in range(max_attempts):
+            try:
+                resp = self.s3.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": k} for k in pending], "Quiet": True},
+                )
+                errors = [
+                    {"key": e.get("Key", ""), "code": e.get("Code", ""), "message": e.get("Message", "")}
+                    for e in resp.get("Errors", [])
+                ]
+            except ClientError as e:
+                err = e.response.get("Error", {})
+                errors = [
+                    {"key": k, "code": err.get("Code", ""), "message": err.get("Message", "")}
+                    for k in pending
+                ]
+            failed = {e["key"] for e in errors}
+            deleted += len(pending) - len(failed)
+            if not failed:
+                return deleted, []
+            pending = [k for k in pending if k in failed]
+            if attempt + 1 < max_attempts:
+                time.sleep(min(8.0, 0.2 * 2 ** attempt) * random.uniform(0.5, 1.5))
+        return deleted, errors
 
     def list_telemetry_events(
         self, org: str, days: int = 7, max_bytes: int = 1_000_000
@@ -199,20 +490,17 @@ class S3Service:
         events: List[Dict[str, Any]] = []
         bytes_fetched = 0
         files_fetched = 0
+        cache_hits = 0
 
         for obj in objects:
             if bytes_fetched >= max_bytes:
                 break
             try:
-                resp = self.s3.get_object(Bucket=self.bucket_name, Key=obj["Key"])
-                body = resp["Body"].read()
+                body, hit = self._get_immutable_object(obj["Key"], obj.get("ETag"))
                 bytes_fetched += len(body)
                 files_fetched += 1
-                data = json.loads(body.decode("utf-8"))
-                for event in data.get("events", []):
-                    event["_userId"] = data.get("userId")
-                    event["_appVersion"] = data.get("appVersion")
-                    events.append(event)
+                cache_hits += int(hit)
+                events.extend(_parse_telemetry_body(obj["Key"], body))
             except Exception:
                 continue
 
@@ -222,4 +510,104 @@ class S3Service:
             "events": events,
             "files_fetched": files_fetched,
             "bytes_fetched": bytes_fetched,
+            "cache_hits": cache_hits,
         }
+
+    def _telemetry_dates(self, org: str) -> List[str]:
+        """Return the YYYY-MM-DD partitions under telemetry/{org}/, newest first."""
+        prefix = f"telemetry/{org}/"
+        dates: List[str] = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, Delimiter="/"
+        ):
+            for p in page.get("CommonPrefixes", []):
+                dates.append(p["Prefix"][len(prefix):].rstrip("/"))
+        return sorted(dates, reverse=True)
+
+    def _get_immutable_object(
+        self, key: str, etag: Optional[str] = None
+    ) -> Tuple[bytes, bool]:
+        """Return (body, cache_hit) for an object that is never rewritten in place.
+
+        With a cache and a listing ETag, a hit skips S3 entirely. On a miss the
+        body is stored under the ETag returned by the GET itself.
+        """
+        if self.cache and etag:
+            body = self.cache.get(key, etag)
+            if body is not None:
+                return body, True
+        resp = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        body = resp["Body"].read()
+        if self.cache and resp.get("ETag"):
+            self.cache.put(key, resp["ETag"], body)
+        return body, False
+
+    def _read_telemetry_object(self, key: str, etag: Optional[str] = None) -> List[Dict[str, Any]]:
+        body, _ = self._get_immutable_object(key, etag)
+        return _parse_telemetry_body(key, body)
+
+    def iter_telemetry_events(
+        self,
+        org: str,
+        days: int = 7,
+        level: Optional[str] = None,
+        pivot: Optional[str] = None,
+        user: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """Yield (event, cursor) pairs for org, newest first.
+
+        Walks the telemetry/{org}/{YYYY-MM-DD}/ partitions one day at a time
+        and fetches one file at a time, so memory is bounded by a single day's
+        listing plus a single file regardless of how much history exists.
+        Files are ordered by the epochMs in their key; events within a file by
+        timestamp. The cursor yielded with each event resumes the stream
+        immediately after that event when passed back in.
+
+        `user` keeps per-device files whose key starts with "{user}_" plus the
+        server-batched .ndjson files, then matches each event's _userId exactly.
+        """
+        prefix = f"telemetry/{org}/"
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+        position = decode_telemetry_cursor(cursor) if cursor else None
+
+        for date in self._telemetry_dates(org):
+            if date < cutoff:
+                break
+            if position and date > position["d"]:
+                continue
+
+            entries = [
+                (_telemetry_key_epoch_ms(obj["Key"]), obj["Key"], obj.get("ETag"))
+                for obj in self.list_objects(f"{prefix}{date}/")
+                if not user
+                or obj["Key"].endswith(".ndjson")
+                or obj["Key"].rsplit("/", 1)[-1].startswith(f"{user}_")
+            ]
+            entries.sort(key=lambda e: (e[0], e[1]), reverse=True)
+
+            for epoch_ms, key, etag in entries:
+                resume_at = 0
+                if position and date == position["d"]:
+                    if (epoch_ms, key) > (position["t"], position["k"]):
+                        continue
+                    if (epoch_ms, key) == (position["t"], position["k"]):
+                        resume_at = position["i"] + 1
+                try:
+                    file_events = self._read_telemetry_object(key, etag)
+                except Exception:
+                    continue
+
+                file_events.sort(key=lambda e: e.get("timestamp", ""), reverse=True)
+                for index in range(resume_at, len(file_events)):
+                    event = file_events[index]
+                    if user and event.get("_userId") != user:
+                        continue
+                    if level and event.get("level") != level:
+                        continue
+                    if pivot and event.get("pivot") != pivot:
+                        continue
+                    yield event, encode_telemetry_cursor(
+                        {"d": date, "t": epoch_ms, "k": key, "i": index}
+                    )
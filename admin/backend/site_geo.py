@@ -0,0 +1,214 @@
+import heapq
+import json
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .s3_service import S3Service
+
+EARTH_RADIUS_M = 6371008.8
+
+# How long a cached index is trusted before sites.json's ETag is checked
+# again. Phones write sites.json directly, so server writes alone cannot
+# invalidate it.
+INDEX_TTL_SECONDS = 10.0
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _unit_vector(lat: float, lng: float) -> Tuple[float, float, float]:
+    p, l = math.radians(lat), math.radians(lng)
+    return (math.cos(p) * math.cos(l), math.cos(p) * math.sin(l), math.sin(p))
+
+
+def _chord_sq(distance_m: float) -> float:
+    """Squared straight-line distance on the unit sphere for a surface distance."""
+    angle = min(math.pi, distance_m / EARTH_RADIUS_M)
+    return (2 * math.sin(angle / 2)) ** 2
+
+
+def site_coords(site: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    """(lat, lng) from site["location"], as sites.json stores it, else top-level keys."""
+    location = site.get("location") or {}
+    if not isinstance(location, dict) or "lat" not in location:
+        location = site
+    try:
+        lat, lng = float(location["lat"]), float(location["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            ch = (ch << 1) | (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = (ch << 1) | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_GEOHASH_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """(lat_lo, lat_hi, lng_lo, lng_hi) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _GEOHASH_BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def geohash_neighbourhood(lat: float, lng: float, precision: int) -> List[str]:
+    """The cell containing (lat, lng) and its (up to) 8 neighbours, centre first."""
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash_bounds(geohash_encode(lat, lng, precision))
+    height, width = lat_hi - lat_lo, lng_hi - lng_lo
+    centre_lat, centre_lng = (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+    cells: List[str] = []
+    for dy, dx in [(0, 0), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]:
+        cell_lat = centre_lat + dy * height
+        if not -90 < cell_lat < 90:
+            continue
+        cell_lng = (centre_lng + dx * width + 180) % 360 - 180
+        cell = geohash_encode(cell_lat, cell_lng, precision)
+        if cell not in cells:
+            cells.append(cell)
+    return cells
+
+
+class SiteIndex:
+    """k-d tree over site positions as 3D unit vectors.
+
+    Working on the sphere rather than on raw lat/lng keeps nearest-neighbour
+    search exact across the antimeridian and near the poles; straight-line
+    distance between unit vectors orders points the same as great-circle
+    distance. Sites without valid lat/lng are left out.
+    """
+
+    def __init__(self, sites: List[Dict[str, Any]]):
+        self.sites: List[Dict[str, Any]] = []
+        self.coords: List[Tuple[float, float]] = []
+        points = []
+        for site in sites:
+            coords = site_coords(site)
+            if coords is None:
+                continue
+            points.append((*_unit_vector(*coords), len(self.sites)))
+            self.sites.append(site)
+            self.coords.append(coords)
+        self._root = self._build(points, 0)
+
+    def __len__(self) -> int:
+        return len(self.sites)
+
+    def _build(self, points: List[Tuple[float, float, float, int]], depth: int):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[axis])
+        mid = len(points) // 2
+        # (point, axis, left, right)
+        return (
+            points[mid],
+            axis,
+            self._build(points[:mid], depth + 1),
+            self._build(points[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, lat: float, lng: float, k: int, radius_m: Optional[float] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """Up to k sites nearest (lat, lng), within radius_m if given, as (metres, site)."""
+        target = _unit_vector(lat, lng)
+        limit = _chord_sq(radius_m) if radius_m is not None else float("inf")
+        best: List[Tuple[float, int]] = []  # max-heap of (-chord_sq, index)
+
+        def visit(node) -> None:
+            if node is None:
+                return
+            point, axis, left, right = node
+            d = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if d <= limit:
+                if len(best) < k:
+                    heapq.heappush(best, (-d, point[3]))
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, (-d, point[3]))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            bound = -best[0][0] if len(best) == k else limit
+            if diff * diff <= bound:
+                visit(far)
+
+        if k > 0:
+            visit(self._root)
+        results = []
+        for _, i in sorted(best, key=lambda item: -item[0]):
+            results.append((haversine_m(lat, lng, *self.coords[i]), self.sites[i]))
+        return results
+
+
+class NearbySites:
+    """Per-org SiteIndex cache, rebuilt when {org}/sites.json changes.
+
+    A cached index is served as-is for INDEX_TTL_SECONDS, then revalidated
+    with a HEAD on sites.json; server-side writes drop it immediately via
+    invalidate().
+    """
+
+    def __init__(self, s3: S3Service, ttl_seconds: float = INDEX_TTL_SECONDS):
+        self.s3 = s3
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # org -> {"etag", "index", "checked_at"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def invalidate(self, org: str) -> None:
+        with self._lock:
+            self._entries.pop(org, None)
+
+    def get(self, org: str) -> Optional[SiteIndex]:
+        with self._lock:
+            entry = self._entries.get(org)
+        now = time.monotonic()
+        if entry and now - entry["checked_at"] < self.ttl_seconds:
+            return entry["index"]
+        if entry and self.s3.head_etag(f"{org}/sites.json") == entry["etag"]:
+            entry["checked_at"] = now
+            return entry["index"]
+        obj = self.s3.get_object_bytes(f"{org}/sites.json")
+        if obj is None:
+            self.invalidate(org)
+            return None
+        body, etag = obj
+        index = SiteIndex(json.loads(body.decode("utf-8")).get("sites", []))
+        with self._lock:
+            self._entries[org] = {"etag": etag, "index": index, "checked_at": time.monotonic()}
+        return index
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .s3_service import S3Service
+from .site_geo import geohash_encode, geohash_neighbourhood, site_coords
+
+# Geohash length of a tile. 5 characters is roughly 4.9 km x 4.9 km at the
+# equator, so a fix plus its 8 neighbours covers ~15 km around the device.
+DEFAULT_TILE_PRECISION = 5
+
+# Sites without a usable location are published in this tile.
+UNLOCATED_TILE = "_unlocated"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def tile_path(tile: str) -> str:
+    """Tile location relative to the org root, like sites.json references."""
+    return f"_tiles/{tile}.json"
+
+
+class SiteTiles:
+    """Publish {org}/sites.json as geohash tiles under {org}/_tiles/.
+
+    Each tile is a sites.json-shaped document ({bucket_root, ..., sites})
+    holding the sites whose location.lat/lng falls in that geohash cell, so
+    the app can parse it with its existing code. {org}/_tiles/index.json
+    lists every tile with its site count and sha256, and the sites.json ETag
+    it was built from. Only tiles whose content changed are rewritten, and tiles left empty
+    are deleted. The leading underscore keeps the prefix clear of site IDs,
+    whose photos live at {org}/{site_id}/.
+    """
+
+    def __init__(self, s3: S3Service, precision: int = DEFAULT_TILE_PRECISION):
+        if not 1 <= precision <= 12:
+            raise ValueError("Tile precision must be between 1 and 12")
+        self.s3 = s3
+        self.precision = precision
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    def get_index(self, org: str) -> Optional[Dict[str, Any]]:
+        return self.s3.get_site_tiles_index(org)
+
+    def ensure_fresh(self, org: str) -> Optional[Dict[str, Any]]:
+        """Return the tile index, republishing first if sites.json moved on."""
+        index = self.get_index(org)
+        etag = self.s3.head_etag(f"{org}/sites.json")
+        if etag is None:
+            return None
+        if index and index.get("source_etag") == etag and index.get("precision") == self.precision:
+            return index
+        return self.publish(org)
+
+    def publish(self, org: str) -> Optional[Dict[str, Any]]:
+        with self._locks_guard:
+            lock = self._locks[org]
+        with lock:
+            return self._publish(org)
+
+    def _publish(self, org: str) -> Optional[Dict[str, Any]]:
+        obj = self.s3.get_object_bytes(f"{org}/sites.json")
+        if obj is None:
+            return None
+        body, etag = obj
+        sites_json = json.loads(body.decode("utf-8"))
+        header = {k: v for k, v in sites_json.items() if k != "sites"}
+
+        grouped: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for site in sites_json.get("sites", []):
+            coords = site_coords(site)
+            tile = geohash_encode(*coords, self.precision) if coords else UNLOCATED_TILE
+            grouped[tile].append(site)
+
+        previous = self.get_index(org) or {}
+        old_tiles = previous.get("tiles", {}) if previous.get("precision") == self.precision else {}
+        tiles: Dict[str, Dict[str, Any]] = {}
+        written = 0
+        for tile, sites in sorted(grouped.items()):
+            doc = json.dumps({**header, "tile": tile, "sites": sites}, indent=2).encode("utf-8")
+            sha = hashlib.sha256(doc).hexdigest()
+            tiles[tile] = {"path": tile_path(tile), "sites": len(sites), "bytes": len(doc), "sha256": sha}
+            if old_tiles.get(tile, {}).get("sha256") == sha:
+                continue
+            self.s3.s3.put_object(
+                Bucket=self.s3.bucket_name,
+                Key=f"{org}/{tile_path(tile)}",
+                Body=doc,
+                ContentType="application/json",
+            )
+            written += 1
+
+        index = {
+            "org": org,
+            "precision": self.precision,
+            "source_etag": etag,
+            "generated_at": _now_iso(),
+            "tiles": tiles,
+        }
+        # Publish the new index before deleting, so a reader never follows
+        # the index to a tile that is already gone.
+        self.s3.put_site_tiles_index(org, index)
+        keep = {f"{org}/{tile_path(tile)}" for tile in tiles} | {f"{org}/{tile_path('index')}"}
+        deleted = self.s3.delete_prefix(f"{org}/_tiles/", keep=keep)["deleted"]
+        index["written"] = written
+        index["deleted"] = deleted
+        return index
+
+    def near(self, index: Dict[str, Any], lat: float, lng: float) -> List[Dict[str, Any]]:
+        """Tiles covering (lat, lng) and its neighbourhood that hold any sites."""
+        cells = geohash_neighbourhood(lat, lng, int(index["precision"]))
+        return [{"tile": c, **index["tiles"][c]} for c in cells if c in index["tiles"]]
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .s3_service import S3Service, WriteConflict
+
+# Removed site IDs are remembered for this many entries; older deltas reset.
+MAX_REMOVED = 5000
+# Recent change records kept in the index for auditing.
+MAX_CHANGES = 200
+
+SITE_OPS = ("add", "upsert", "update", "delete")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _site_map(sites_json: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # Sites without an id cannot be versioned (or patched); they are left out
+    # rather than all sharing one "None" entry.
+    return {
+        str(site["id"]): site for site in sites_json.get("sites", [])
+        if isinstance(site, dict) and site.get("id") not in (None, "")
+    }
+
+
+def sites_missing_ids(sites_json: Dict[str, Any]) -> List[int]:
+    """Positions in sites_json["sites"] of sites that have no id."""
+    return [
+        i for i, site in enumerate(sites_json.get("sites") or [])
+        if not isinstance(site, dict) or site.get("id") in (None, "")
+    ]
+
+
+def _header(sites_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Top-level fields other than `sites` (bucket_root and friends)."""
+    return {k: v for k, v in sites_json.items() if k != "sites"}
+
+
+def apply_site_ops(sites_json: Dict[str, Any], ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply site-level operations to sites_json in place; one result per op.
+
+    - add: insert `site` unless its id already exists (the remote copy wins,
+      as when a phone promotes a local site)
+    - upsert: insert or replace the whole site
+    - update: shallow-merge `site` fields into an existing site
+    - delete: remove the site with `id`
+
+    Raises ValueError for malformed ops, before anything is changed.
+    """
+    for op in ops:
+        if op.get("op") not in SITE_OPS:
+            raise ValueError(f"Unknown op {op.get('op')!r}; expected one of {', '.join(SITE_OPS)}")
+        site_id = op.get("id") or (op.get("site") or {}).get("id")
+        if not site_id:
+            raise ValueError(f"{op['op']} needs a site id")
+        if op["op"] != "delete" and not isinstance(op.get("site"), dict):
+            raise ValueError(f"{op['op']} {site_id} needs a site object")
+
+    sites = sites_json.setdefault("sites", [])
+    results = []
+    for op in ops:
+        site_id = str(op.get("id") or op["site"]["id"])
+        position = next((i for i, site in enumerate(sites) if str(site.get("id")) == site_id), None)
+        kind = op["op"]
+        if kind == "add":
+            if position is None:
+                sites.append({**op["site"], "id": site_id})
+                status = "added"
+            else:
+                status = "exists"
+        elif kind == "upsert":
+            site = {**op["site"], "id": site_id}
+            if position is None:
+                sites.append(site)
+                status = "added"
+            else:
+                sites[position] = site
+                status = "replaced"
+        elif kind == "update":
+            if position is None:
+                status = "not_found"
+            else:
+                sites[position] = {**sites[position], **op["site"], "id": site_id}
+                status = "updated"
+        else:
+            if position is None:
+                status = "not_found"
+            else:
+                del sites[position]
+                status = "deleted"
+        results.append({"op": kind, "id": site_id, "status": status})
+    return results
+
+
+class SitesStore:
+    """Version index over {org}/sites.json, kept at {org}/sites_index.json.
+
+    The index only advances on the backend's own writes (commit() after a
+    PUT or upload, and patch()): each site is re-hashed and those that were
+    added or edited get the next version. Removed IDs are kept as tombstones.
+    Reads never write. Phones still write sites.json directly, so delta()
+    also compares digests against the index and returns any site the index
+    has not caught up with yet. A client holding version N then fetches only
+    what changed after N.
+
+        {"org", "version", "etag", "updated_at",
+         "header": {sha256, version},
+         "sites": {id: {sha256, version}},
+         "removed": {id: version}, "removed_floor",
+         "changes": [{version, at, added, changed, removed, header}]}
+    """
+
+    def __init__(self, s3: S3Service):
+        self.s3 = s3
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+    def _lock(self, org: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[org]
+
+    def read(self, org: str) -> Tuple[Optional[Dict[str, Any]], Optional[str], Optional[Dict[str, Any]]]:
+        """Return (sites_json, etag, index) as stored; index is None until the first commit."""
+        obj = self.s3.get_object_bytes(f"{org}/sites.json")
+        if obj is None:
+            return None, None, None
+        body, etag = obj
+        return json.loads(body.decode("utf-8")), etag, self.s3.get_sites_index(org)
+
+    def commit(self, org: str) -> Optional[Dict[str, Any]]:
+        """Bring the index up to the current sites.json; call after writing it."""
+        obj = self.s3.get_object_bytes(f"{org}/sites.json")
+        if obj is None:
+            return None
+        body, etag = obj
+        return self._commit(org, json.loads(body.decode("utf-8")), etag)
+
+    def _commit(self, org: str, sites_json: Dict[str, Any], etag: str) -> Dict[str, Any]:
+        with self._lock(org):
+            index = self.s3.get_sites_index(org)
+            if index and index.get("etag") == etag:
+                return index
+            index = self._advance(org, index, sites_json, etag)
+            self.s3.put_sites_index(org, index)
+            return index
+
+    def patch(self, org: str, ops: List[Dict[str, Any]], max_attempts: int = 5) -> Dict[str, Any]:
+        """Apply ops to sites.json with a read-modify-write guarded by ETag.
+
+        A concurrent writer between our read and write makes S3 reject the
+        write; the ops are then replayed on the fresh copy after a short
+        jittered backoff. Raises LookupError without a sites.json, ValueError
+        for bad ops, and WriteConflict once attempts run out.
+        """
+        for attempt in range(1, max_attempts + 1):
+            obj = self.s3.get_object_bytes(f"{org}/sites.json")
+            if obj is None:
+                raise LookupError("sites.json not found")
+            body, etag = obj
+            sites_json = json.loads(body.decode("utf-8"))
+            results = apply_site_ops(sites_json, ops)
+            if all(r["status"] in ("exists", "not_found") for r in results):
+                break
+            try:
+                etag = self.s3.put_json_if_match(f"{org}/sites.json", sites_json, etag)
+                break
+            except WriteConflict:
+                if attempt == max_attempts:
+                    raise
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+        # Index exactly what was written (or read, for a no-op), not whatever
+        # sites.json holds by now.
+        index = self._commit(org, sites_json, etag)
+        return {"version": index["version"], "attempts": attempt, "results": results}
+
+    def _advance(
+        self,
+        org: str,
+        index: Optional[Dict[str, Any]],
+        sites_json: Dict[str, Any],
+        etag: str,
+    ) -> Dict[str, Any]:
+        index = index or {
+            "org": org, "version": 0, "header": {}, "sites": {}, "removed": {},
+            "removed_floor": 0, "changes": [],
+        }
+        version = int(index["version"]) + 1
+        old_sites = index["sites"]
+        sites: Dict[str, Dict[str, Any]] = {}
+        added: List[str] = []
+        changed: List[str] = []
+        for site_id, site in _site_map(sites_json).items():
+            sha = _digest(site)
+            old = old_sites.get(site_id)
+            if old and old["sha256"] == sha:
+                sites[site_id] = old
+                continue
+            sites[site_id] = {"sha256": sha, "version": version}
+            (changed if old else added).append(site_id)
+
+        removed = dict(index.get("removed", {}))
+        gone = [site_id for site_id in old_sites if site_id not in sites]
+        for site_id in gone:
+            removed[site_id] = version
+        for site_id in sites:
+            removed.pop(site_id, None)
+        floor = int(index.get("removed_floor", 0))
+        if len(removed) > MAX_REMOVED:
+            for site_id, v in sorted(removed.items(), key=lambda kv: kv[1])[: len(removed) - MAX_REMOVED]:
+                floor = max(floor, v)
+                del removed[site_id]
+
+        header = index.get("header") or {}
+        header_sha = _digest(_header(sites_json))
+        header_changed = header.get("sha256") != header_sha
+        if header_changed:
+            header = {"sha256": header_sha, "version": version}
+
+        changes = list(index.get("changes", []))
+        if added or changed or gone or header_changed:
+            changes.append({
+                "version": version,
+                "at": _now_iso(),
+                "added": added,
+                "changed": changed,
+                "removed": gone,
+                "header": header_changed,
+            })
+        else:
+            # Rewritten with identical content (e.g. key order): no new version.
+            version -= 1
+        return {
+            "org": org,
+            "version": version,
+            "etag": etag,
+            "updated_at": _now_iso(),
+            "header": header,
+            "sites": sites,
+            "removed": removed,
+            "removed_floor": floor,
+            "changes": changes[-MAX_CHANGES:],
+        }
+
+    def delta(
+        self, org: str, sites_json: Dict[str, Any], index: Optional[Dict[str, Any]], since: int
+    ) -> Dict[str, Any]:
+        """Sites added or changed, and IDs removed, after version `since`.
+
+        Sites that differ from the index (written since its last commit, or
+        never indexed) are always included, and IDs the index knows but
+        sites.json no longer has are always reported removed. With `reset`
+        true the client missed removals that are no longer tracked, or holds
+        a version this index never reached: `sites` is then the full list and
+        should replace its copy.
+        """
+        index = index or {"version": 0, "header": {}, "sites": {}, "removed": {}, "removed_floor": 0}
+        version = int(index["version"])
+        reset = since < int(index.get("removed_floor", 0)) or since > version
+        if reset:
+            since = 0
+        versions = index["sites"]
+        current = _site_map(sites_json)
+        sites = []
+        for site_id, site in current.items():
+            known = versions.get(site_id)
+            if known is None or known["version"] > since or known["sha256"] != _digest(site):
+                sites.append(site)
+        removed = {i for i, v in index.get("removed", {}).items() if v > since}
+        removed.update(i for i in versions if i not in current)
+        out: Dict[str, Any] = {
+            "org": org,
+            "version": version,
+            "since_version": since,
+            "reset": reset,
+            "sites": sites,
+            "removed": sorted(removed - current.keys()),
+        }
+        header = index.get("header") or {}
+        if header.get("version", 0) > since or header.get("sha256") != _digest(_header(sites_json)):
+            out["header"] = _header(sites_json)
+        return out
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from .s3_service import S3Service
+
+
+class TelemetryIngestor:
+    """Coalesce telemetry batches from many devices into a few large S3 writes.
+
+    Batches are buffered per (org, UTC hour) as NDJSON lines, one event per
+    line with `_userId`/`_appVersion` attached, and flushed to
+
+        telemetry/{org}/{YYYY-MM-DD}/ingest-{HH}_{epochMs}.ndjson
+
+    when a buffer reaches max_bytes, when it is older than max_age_seconds,
+    or when its hour has passed. The date partition matches the per-device
+    files, so the readers and the telemetry/ lifecycle rule treat both alike.
+    Anything still buffered is lost if the process dies before a flush.
+
+    A failed write is put back for the next tick. While S3 stays unreachable
+    the buffers are capped at max_pending_bytes in total: the oldest lines
+    of the failing buffer are dropped first and counted in pending().
+    """
+
+    def __init__(
+        self,
+        s3: S3Service,
+        max_bytes: int = 4 * 1024 * 1024,
+        max_age_seconds: float = 300.0,
+        tick_seconds: float = 10.0,
+        max_pending_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.s3 = s3
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.tick_seconds = tick_seconds
+        self.max_pending_bytes = max_pending_bytes
+        self._dropped_events = 0
+        self._dropped_bytes = 0
+        self._lock = threading.Lock()
+        # (org, "YYYY-MM-DD", "HH") -> {"lines": [...], "bytes": n, "since": monotonic}
+        self._buffers: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="telemetry-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(force=True)
+
+    def add(self, org: str, user_id: str, app_version: Optional[str], events: List[Dict[str, Any]]) -> int:
+        now = datetime.now(timezone.utc)
+        partition = (org, now.strftime("%Y-%m-%d"), now.strftime("%H"))
+        lines = []
+        for event in events:
+            event = dict(event)
+            event["_userId"] = user_id
+            event["_appVersion"] = app_version
+            lines.append(json.dumps(event, separators=(",", ":")) + "\n")
+        size = sum(len(line) for line in lines)
+        full = None
+        with self._lock:
+            buf = self._buffers.setdefault(
+                partition, {"lines": [], "bytes": 0, "since": time.monotonic()}
+            )
+            buf["lines"].extend(lines)
+            buf["bytes"] += size
+            if buf["bytes"] >= self.max_bytes:
+                full = (partition, self._buffers.pop(partition))
+        if full:
+            self._write(*full)
+        return len(lines)
+
+    def flush(self, force: bool = False) -> int:
+        """Write out due buffers (all of them if force). Returns objects written."""
+        now = datetime.now(timezone.utc)
+        current_hour = (now.strftime("%Y-%m-%d"), now.strftime("%H"))
+        due = []
+        with self._lock:
+            for partition, buf in list(self._buffers.items()):
+                expired = time.monotonic() - buf["since"] >= self.max_age_seconds
+                if force or expired or partition[1:] != current_hour:
+                    due.append((partition, self._buffers.pop(partition)))
+        written = 0
+        for partition, buf in due:
+            written += int(self._write(partition, buf))
+        return written
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "buffers": len(self._buffers),
+                "events": sum(len(b["lines"]) for b in self._buffers.values()),
+                "bytes": sum(b["bytes"] for b in self._buffers.values()),
+                "dropped_events": self._dropped_events,
+                "dropped_bytes": self._dropped_bytes,
+            }
+
+    def _write(self, partition: Tuple[str, str, str], buf: Dict[str, Any]) -> bool:
+        org, date, hour = partition
+        key = f"telemetry/{org}/{date}/ingest-{hour}_{int(time.time() * 1000)}.ndjson"
+        try:
+            self.s3.s3.put_object(
+                Bucket=self.s3.bucket_name,
+                Key=key,
+                Body="".join(buf["lines"]).encode("utf-8"),
+                ContentType="application/x-ndjson",
+            )
+            return True
+        except Exception:
+            # Put the lines back in front of anything buffered since, so the
+            # next tick retries them.
+            with self._lock:
+                current = self._buffers.get(partition)
+                if current:
+                    buf["lines"].extend(current["lines"])
+                    buf["bytes"] += current["bytes"]
+                self._buffers[partition] = buf
+                self._trim(buf)
+            return False
+
+    def _trim(self, buf: Dict[str, Any]) -> None:
+        # Called with self._lock held. Drops buf's oldest lines until all
+        # buffers together fit in max_pending_bytes.
+        excess = sum(b["bytes"] for b in self._buffers.values()) - self.max_pending_bytes
+        drop = 0
+        while excess > 0 and drop < len(buf["lines"]):
+            size = len(buf["lines"][drop])
+            excess -= size
+            buf["bytes"] -= size
+            self._dropped_bytes += size
+            drop += 1
+        if drop:
+            del buf["lines"][:drop]
+            self._dropped_events += drop
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.tick_seconds):
+            self.flush()
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from .cognito_service import CognitoService
+
+REQUIRED_FIELDS = ("name", "email", "password")
+
+
+def parse_user_rows(filename: str, content: bytes) -> List[Dict[str, str]]:
+    """Rows of {name, email, password} from a .csv (with header) or .json upload.
+
+    JSON may be a list of users or {"users": [...]}. Raises ValueError if the
+    file cannot be read at all; per-row problems are reported by the import.
+    """
+    text = content.decode("utf-8-sig")
+    if filename.lower().endswith(".csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        fields = {(f or "").strip().lower() for f in reader.fieldnames or []}
+        missing = [f for f in REQUIRED_FIELDS if f not in fields]
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+        return [
+            {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+            for row in reader
+        ]
+    if filename.lower().endswith(".json"):
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        users = data.get("users") if isinstance(data, dict) else data
+        if not isinstance(users, list):
+            raise ValueError('JSON must be a list of users or {"users": [...]}')
+        return [
+            {k: str(u.get(k) or "").strip() for k in REQUIRED_FIELDS}
+            if isinstance(u, dict) else {}
+            for u in users
+        ]
+    raise ValueError("Upload a .csv or .json file")
+
+
+def _error(e: Exception) -> str:
+    if isinstance(e, ClientError):
+        err = e.response.get("Error", {})
+        return f"{err.get('Code', '')}: {err.get('Message', '')}"
+    return str(e)
+
+
+class UserImporter:
+    """Create or update many Cognito users concurrently under Cognito's quotas.
+
+    Pacing and throttle retries come from the Cognito client itself (see
+    cognito_throttle), so any number of workers stays within the rates set
+    for AdminCreateUser and AdminSetUserPassword. users.json is not touched
+    here; the caller writes it once from the results.
+    """
+
+    def __init__(self, cognito: CognitoService, workers: int = 8):
+        self.cognito = cognito
+        self.workers = workers
+
+    def import_one(self, user_pool_id: str, row: Dict[str, str]) -> Dict[str, Any]:
+        username = row["username"]
+        try:
+            try:
+                self.cognito.create_user(user_pool_id, username, row["name"], row["email"], row["password"])
+                status = "created"
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "UsernameExistsException":
+                    raise
+                status = "updated"
+            self.cognito.update_password(user_pool_id, username, row["password"])
+        except Exception as e:
+            return {"username": username, "status": "failed", "error": _error(e)}
+        return {"username": username, "status": status}
+
+    def run(
+        self,
+        user_pool_id: str,
+        rows: List[Dict[str, str]],
+        progress: Optional[Callable[[Dict[str, int]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Import rows ({username, name, email, password}); one result per row, in order."""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        todo = []
+        seen = set()
+        for i, row in enumerate(rows):
+            missing = [f for f in REQUIRED_FIELDS if not row.get(f)]
+            if missing:
+                results[i] = {"username": row.get("username") or None, "status": "failed",
+                              "error": f"missing {', '.join(missing)}"}
+            elif row["username"] in seen:
+                results[i] = {"username": row["username"], "status": "failed", "error": "duplicate in file"}
+            else:
+                seen.add(row["username"])
+                todo.append(i)
+
+        counts = {"created": 0, "updated": 0, "failed": len(rows) - len(todo)}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.import_one, user_pool_id, rows[i]): i for i in todo}
+            for fut in as_completed(futures):
+                result = fut.result()
+                results[futures[fut]] = result
+                counts[result["status"]] += 1
+                if progress:
+                    progress(dict(counts))
+        return [r for r in results if r is not None]
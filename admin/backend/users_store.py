@@ -0,0 +1,121 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Set, Tuple
+
+from .s3_service import S3Service, WriteConflict
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def apply_user_ops(users_json: Dict[str, Any], ops: List[Dict[str, Any]]) -> None:
+    """Apply users.json ops in place.
+
+    - {"op": "upsert", "entry": {...}}: replace or append by username
+    - {"op": "delete", "username": ...}
+    - {"op": "password", "username": ..., "password": ...}: update an existing entry
+    """
+    users = users_json.setdefault("users", [])
+    for op in ops:
+        if op["op"] == "upsert":
+            name = op["entry"]["username"].lower()
+            users[:] = [u for u in users if (u.get("username") or "").lower() != name]
+            users.append(op["entry"])
+        elif op["op"] == "delete":
+            name = op["username"].lower()
+            users[:] = [u for u in users if (u.get("username") or "").lower() != name]
+        elif op["op"] == "password":
+            name = op["username"].lower()
+            for u in users:
+                if (u.get("username") or "").lower() == name:
+                    u["password"] = op["password"]
+        else:
+            raise ValueError(f"Unknown users.json op {op['op']!r}")
+
+
+class UsersJsonWriter:
+    """Coalesce users.json changes per org into single ETag-conditional writes.
+
+    The first caller for an org waits `window_seconds` to collect whatever
+    else arrives, then applies the whole batch in one read-modify-write that
+    only lands if users.json still has the ETag it read; on a conflict the
+    batch is replayed on a fresh copy. Ops arriving during a write form the
+    next batch. Every caller blocks until the write holding its ops succeeds
+    (or gets that write's exception).
+    """
+
+    def __init__(self, s3: S3Service, window_seconds: float = 0.05, max_attempts: int = 5):
+        self.s3 = s3
+        self.window_seconds = window_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[Tuple[List[Dict[str, Any]], Future]]] = {}
+        self._flushing: Set[str] = set()
+
+    def upsert(self, org: str, entries: List[Dict[str, Any]]) -> None:
+        self.submit(org, [{"op": "upsert", "entry": e} for e in entries])
+
+    def delete(self, org: str, username: str) -> None:
+        self.submit(org, [{"op": "delete", "username": username}])
+
+    def set_password(self, org: str, username: str, password: str) -> None:
+        self.submit(org, [{"op": "password", "username": username, "password": password}])
+
+    def submit(self, org: str, ops: List[Dict[str, Any]]) -> None:
+        fut: Future = Future()
+        with self._lock:
+            self._pending.setdefault(org, []).append((ops, fut))
+            leader = org not in self._flushing
+            if leader:
+                self._flushing.add(org)
+        if leader:
+            time.sleep(self.window_seconds)
+            self._drain(org)
+        fut.result()
+
+    def _drain(self, org: str) -> None:
+        while True:
+            with self._lock:
+                batch = self._pending.pop(org, [])
+                if not batch:
+                    self._flushing.discard(org)
+                    return
+            try:
+                self._write(org, [op for ops, _ in batch for op in ops])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+            else:
+                for _, fut in batch:
+                    fut.set_result(None)
+
+    def _write(self, org: str, ops: List[Dict[str, Any]]) -> None:
+        key = f"{org}/users.json"
+        for attempt in range(1, self.max_attempts + 1):
+            obj = self.s3.get_object_bytes(key)
+            if obj is None:
+                # Like the single-user endpoints: deletes and password changes
+                # on an org without users.json do not create one.
+                if not any(op["op"] == "upsert" for op in ops):
+                    return
+                users_json, etag = {
+                    "bucket_root": f"https://{self.s3.bucket_name}.s3.amazonaws.com/{org}/",
+                    "org": org,
+                    "users": [],
+                }, None
+            else:
+                users_json, etag = json.loads(obj[0].decode("utf-8")), obj[1]
+            apply_user_ops(users_json, ops)
+            users_json["updated_at"] = _now_iso()
+            try:
+                self.s3.put_json_if_match(key, users_json, etag)
+                return
+            except WriteConflict:
+                if attempt == self.max_attempts:
+                    raise
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
@@ -5,6 +5,8 @@ const orgStatus = document.getElementById('org-status');
 const addUserForm = document.getElementById('add-user-form');
 const usersList = document.getElementById('users-list');
 const allUsers = document.getElementById('all-users');
+const allUsersSearch = document.getElementById('all-users-search');
+const moreUsersBtn = document.getElementById('more-users-btn');
 const statusBar = document.getElementById('status');
 const formError = document.getElementById('form-error');
 const passwordRules = document.getElementById('password-rules');
@@ -22,9 +24,16 @@ const loadTelemetryBtn = document.getElementById('load-telemetry-btn');
 const deleteTelemetryBtn = document.getElementById('delete-telemetry-btn');
 const telemetryStatus = document.getElementById('telemetry-status');
 const telemetryTableWrap = document.getElementById('telemetry-table-wrap');
+const moreTelemetryBtn = document.getElementById('more-telemetry-btn');
 
 let currentOrg = '';
 let sitesData = null;
+let telemetryEvents = [];
+let telemetryCursor = null;
+let usersCursor = null;
+let usersSearchTimer = null;
+// Bumped per /api/users request; replies to anything but the latest are dropped.
+let usersRequestSeq = 0;
 let config = { bucketRootTemplate: 'https://<bucket>.s3.amazonaws.com/{org}/' };
 
 function setStatus(message, isError = false) {
@@ -73,11 +82,48 @@ function bucketRootForOrg(org) {
   return template.replace('{org}', org || '');
 }
 
+const presignedUrls = new Map();
+
 function presignedUrlForKey(key) {
+  const cached = presignedUrls.get(key);
+  if (cached && Date.parse(cached.expires_at) - Date.now() > 60 * 1000) {
+    return cached.url;
+  }
   const encoded = encodeURIComponent(key || '');
   return `/api/s3?key=${encoded}`;
 }
 
+function thumbnailUrlForKey(key, width = 320) {
+  return `/api/img/${(key || '').split('/').map(encodeURIComponent).join('/')}?w=${width}`;
+}
+
+// Sign every key in one request so a gallery renders without a backend round
+// trip per image. Failures fall back to the per-key /api/s3 redirect.
+async function presignKeys(keys) {
+  const missing = [...new Set(keys.filter(Boolean))].filter(
+    (key) => presignedUrlForKey(key).startsWith('/api/s3')
+  );
+  for (let i = 0; i < missing.length; i += 1000) {
+    try {
+      const data = await api('/api/s3/presign', {
+        method: 'POST',
+        body: JSON.stringify({ keys: missing.slice(i, i + 1000) }),
+      });
+      Object.entries(data.urls).forEach(([key, entry]) => presignedUrls.set(key, entry));
+    } catch (err) {
+      return;
+    }
+  }
+}
+
+function siteImageKeys() {
+  return (sitesData?.sites || []).flatMap((site) =>
+    [site.reference_portrait, site.reference_landscape]
+      .filter(Boolean)
+      .map((path) => `${currentOrg}/${path}`)
+  );
+}
+
 async function loadHealth() {
   try {
     const data = await api('/api/health');
@@ -192,9 +238,18 @@ async function loadOrgUsers() {
   });
 }
 
-async function loadAllUsers() {
-  allUsers.innerHTML = '';
-  const data = await api('/api/users');
+async function loadAllUsers(append = false) {
+  const params = new URLSearchParams({ limit: '60' });
+  const q = allUsersSearch?.value.trim();
+  if (q) params.set('q', q);
+  if (append && usersCursor) params.set('cursor', usersCursor);
+  const seq = ++usersRequestSeq;
+  const data = await api(`/api/users?${params}`);
+  // A newer search (or page) was started while this one was in flight.
+  if (seq !== usersRequestSeq) return;
+  if (!append) allUsers.innerHTML = '';
+  usersCursor = data.next_cursor;
+  moreUsersBtn?.classList.toggle('hidden', !usersCursor);
   data.users.forEach((user) => {
     const item = document.createElement('div');
     item.className = 'list-item';
@@ -228,6 +283,7 @@ async function loadSites() {
   }
   sitesData = data.sites_json;
   bucketRootInput.value = sitesData.bucket_root || bucketRootForOrg(currentOrg);
+  await presignKeys(siteImageKeys());
   renderSites();
   showAlert(`Loaded sites.json for ${currentOrg}.`);
 }
@@ -259,12 +315,8 @@ function renderSites() {
     const card = document.createElement('div');
     card.className = 'site-card';
     const bucketRoot = (bucketRootInput.value || '').replace(/\/+$/, '') + '/';
-    const portraitUrl = site.reference_portrait
-      ? presignedUrlForKey(`${currentOrg}/${site.reference_portrait}`)
-      : '';
-    const landscapeUrl = site.reference_landscape
-      ? presignedUrlForKey(`${currentOrg}/${site.reference_landscape}`)
-      : '';
+    const portraitKey = site.reference_portrait ? `${currentOrg}/${site.reference_portrait}` : '';
+    const landscapeKey = site.reference_landscape ? `${currentOrg}/${site.reference_landscape}` : '';
 
     card.innerHTML = `
       <div class="row">
@@ -284,7 +336,9 @@ function renderSites() {
       <div class="row">
         <div>
           <div class="muted">Portrait</div>
-          ${portraitUrl ? `<img src="${portraitUrl}" alt="portrait" />` : '<div class="muted">No image</div>'}
+          ${portraitKey
+            ? `<a href="${presignedUrlForKey(portraitKey)}" target="_blank"><img src="${thumbnailUrlForKey(portraitKey)}" alt="portrait" /></a>`
+            : '<div class="muted">No image</div>'}
           <div class="row">
             <input type="file" data-orientation="portrait" data-index="${index}" accept="image/*" />
             <button class="secondary" data-action="upload" data-orientation="portrait" data-index="${index}">Upload</button>
@@ -292,7 +346,9 @@ function renderSites() {
         </div>
         <div>
           <div class="muted">Landscape</div>
-          ${landscapeUrl ? `<img src="${landscapeUrl}" alt="landscape" />` : '<div class="muted">No image</div>'}
+          ${landscapeKey
+            ? `<a href="${presignedUrlForKey(landscapeKey)}" target="_blank"><img src="${thumbnailUrlForKey(landscapeKey)}" alt="landscape" /></a>`
+            : '<div class="muted">No image</div>'}
           <div class="row">
             <input type="file" data-orientation="landscape" data-index="${index}" accept="image/*" />
             <button class="secondary" data-action="upload" data-orientation="landscape" data-index="${index}">Upload</button>
@@ -311,6 +367,10 @@ function renderSites() {
         Survey JSON
         <textarea data-field="survey" data-index="${index}" rows="4" spellcheck="false">${JSON.stringify(site.survey || [], null, 2)}</textarea>
       </label>
+      <details data-action="gallery" data-index="${index}">
+        <summary>Uploaded references</summary>
+        <div class="ghost-gallery muted">Loading…</div>
+      </details>
       <button data-action="delete-site" data-index="${index}">Delete Site</button>
     `;
 
@@ -346,6 +406,23 @@ function renderSites() {
     });
   });
 
+  sitesList.querySelectorAll('details[data-action="gallery"]').forEach((details) => {
+    details.addEventListener('toggle', async () => {
+      if (!details.open) return;
+      const site = sitesData.sites[Number(details.dataset.index)];
+      const gallery = details.querySelector('.ghost-gallery');
+      try {
+        const catalog = await api(
+          `/api/orgs/${encodeURIComponent(currentOrg)}/sites/${encodeURIComponent(site.id)}/ghosts`
+        );
+        await presignKeys((catalog.images || []).map((img) => `${currentOrg}/${img.path}`));
+        renderGhostGallery(gallery, site, catalog.images || []);
+      } catch (err) {
+        gallery.textContent = err.message;
+      }
+    });
+  });
+
   sitesList.querySelectorAll('button[data-action="upload"]').forEach((btn) => {
     btn.addEventListener('click', async () => {
       const index = Number(btn.dataset.index);
@@ -388,6 +465,29 @@ function renderSites() {
   });
 }
 
+function renderGhostGallery(gallery, site, images) {
+  if (!images.length) {
+    gallery.textContent = 'No uploads recorded for this site.';
+    return;
+  }
+  gallery.innerHTML = images.slice().reverse().map((img) => `
+    <div class="ghost-item">
+      <a href="${presignedUrlForKey(`${currentOrg}/${img.path}`)}" target="_blank">
+        <img src="${thumbnailUrlForKey(`${currentOrg}/${img.path}`)}" alt="${img.filename}" loading="lazy" />
+      </a>
+      <div>${img.orientation} · ${img.width || '?'}×${img.height || '?'} · ${(img.bytes / 1024 / 1024).toFixed(1)} MB</div>
+      <div>${toIST(img.uploaded_at)}</div>
+      <button class="secondary" data-path="${img.path}" data-orientation="${img.orientation}">Use</button>
+    </div>`).join('');
+  gallery.querySelectorAll('button[data-path]').forEach((btn) => {
+    btn.addEventListener('click', () => {
+      site[`reference_${btn.dataset.orientation}`] = btn.dataset.path;
+      renderSites();
+      showAlert('Reference selected. Save to persist sites.json.');
+    });
+  });
+}
+
 loadSitesBtn?.addEventListener('click', () => loadSites());
 saveSitesBtn?.addEventListener('click', () => saveSites());
 addSiteBtn?.addEventListener('click', () => {
@@ -431,18 +531,46 @@ sitesUpload?.addEventListener('change', async () => {
   }
 });
 
-async function loadTelemetry() {
+async function fetchTelemetryPage(cursor) {
+  const params = new URLSearchParams({ limit: '200' });
+  if (cursor) params.set('cursor', cursor);
+  const resp = await fetch(`/api/orgs/${encodeURIComponent(currentOrg)}/telemetry/events?${params}`);
+  if (!resp.ok) {
+    const text = await resp.text();
+    throw new Error(text || resp.statusText);
+  }
+  const lines = (await resp.text()).split('\n').filter((line) => line.trim());
+  const events = [];
+  let next = null;
+  for (const line of lines) {
+    const obj = JSON.parse(line);
+    if ('next_cursor' in obj) {
+      next = obj.next_cursor;
+    } else {
+      events.push(obj);
+    }
+  }
+  return { events, next };
+}
+
+async function loadTelemetry(append = false) {
   if (!currentOrg) {
     showAlert('Select an org first.', 'error');
     return;
   }
   telemetryStatus.textContent = 'Loading…';
-  telemetryTableWrap.innerHTML = '';
+  if (!append) {
+    telemetryEvents = [];
+    telemetryCursor = null;
+    telemetryTableWrap.innerHTML = '';
+  }
   try {
-    const data = await api(`/api/orgs/${encodeURIComponent(currentOrg)}/telemetry`);
-    renderTelemetry(data);
-    telemetryStatus.textContent =
-      `${data.events.length} events · ${data.files_fetched} file(s) · ${(data.bytes_fetched / 1024).toFixed(1)} KB`;
+    const page = await fetchTelemetryPage(append ? telemetryCursor : null);
+    telemetryEvents = telemetryEvents.concat(page.events);
+    telemetryCursor = page.next;
+    renderTelemetry({ events: telemetryEvents });
+    telemetryStatus.textContent = `${telemetryEvents.length} events${telemetryCursor ? ' · more available' : ''}`;
+    moreTelemetryBtn?.classList.toggle('hidden', !telemetryCursor);
   } catch (err) {
     telemetryStatus.textContent = '';
     showAlert(err.message, 'error');
@@ -480,6 +608,14 @@ function renderTelemetry(data) {
 }
 
 loadTelemetryBtn?.addEventListener('click', () => loadTelemetry());
+moreTelemetryBtn?.addEventListener('click', () => loadTelemetry(true));
+
+moreUsersBtn?.addEventListener('click', () => loadAllUsers(true).catch((err) => showAlert(err.message, 'error')));
+
+allUsersSearch?.addEventListener('input', () => {
+  clearTimeout(usersSearchTimer);
+  usersSearchTimer = setTimeout(() => loadAllUsers().catch((err) => showAlert(err.message, 'error')), 300);
+});
 
 deleteTelemetryBtn?.addEventListener('click', async () => {
   if (!currentOrg) {
@@ -488,10 +624,24 @@ deleteTelemetryBtn?.addEventListener('click', async () => {
   }
   if (!confirm(`Delete all telemetry logs for "${currentOrg}"? This cannot be undone.`)) return;
   try {
-    const data = await api(`/api/orgs/${encodeURIComponent(currentOrg)}/telemetry`, { method: 'DELETE' });
+    let job = await api(`/api/orgs/${encodeURIComponent(currentOrg)}/cleanup`, {
+      method: 'POST',
+      body: JSON.stringify({ scope: 'telemetry' }),
+    });
     telemetryTableWrap.innerHTML = '';
+    telemetryEvents = [];
+    telemetryCursor = null;
+    moreTelemetryBtn?.classList.add('hidden');
+    while (job.status === 'pending' || job.status === 'running') {
+      telemetryStatus.textContent = `Deleting… ${job.deleted} object(s) removed`;
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+      job = await api(`/api/jobs/${job.id}`);
+    }
     telemetryStatus.textContent = '';
-    showAlert(`Deleted ${data.deleted} telemetry object(s) for "${currentOrg}".`);
+    if (job.status === 'failed') {
+      throw new Error(job.error || `Deleted ${job.deleted} object(s); ${job.failed} could not be deleted.`);
+    }
+    showAlert(`Deleted ${job.deleted} telemetry object(s) for "${currentOrg}".`);
   } catch (err) {
     showAlert(err.message, 'error');
   }
@@ -12,47 +12,60 @@
 # phone. It will then add all users listed in org1_users.json, and allow them
 # IAM write/read access to the bucket_root in the org1_users.json file. See
 # docs/auth.md for more details.
+#
+# Pass --reconcile to diff the config against the pool first: missing users
+# are created, users whose email/name changed are updated, and everyone else
+# is left alone, so re-running an unchanged config makes no write calls.
 
 import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import boto3
 import click
 
+# Shared Cognito helpers from the admin backend: the name -> ID resolver
+# (paginated, cached on disk) and the rate-limited, retrying client.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'admin', 'backend'))
+from cognito_ids import CognitoIdResolver, default_cache_dir  # noqa: E402
+from cognito_throttle import cognito_client  # noqa: E402
+
 # Initialize AWS clients
-cognito_idp = boto3.client('cognito-idp')
-cognito_identity = boto3.client('cognito-identity')
+cognito_idp = cognito_client('cognito-idp')
+cognito_identity = cognito_client('cognito-identity')
 iam = boto3.client('iam')
+ids = CognitoIdResolver(cognito_idp, cognito_identity, cache_dir=default_cache_dir())
 
 
 def get_or_create_user_pool(name):
-    pools = cognito_idp.list_user_pools(MaxResults=60)['UserPools']
-    for pool in pools:
-        if pool['Name'] == name:
-            return pool['Id']
+    pool_id = ids.user_pool_id(name)
+    if pool_id:
+        return pool_id
     resp = cognito_idp.create_user_pool(PoolName=name)
+    ids.remember('user_pools', name, resp['UserPool']['Id'])
     return resp['UserPool']['Id']
 
 
 def get_or_create_user_pool_client(pool_id, client_name):
-    clients = cognito_idp.list_user_pool_clients(
-        UserPoolId=pool_id, MaxResults=60)['UserPoolClients']
-    for client in clients:
-        if client['ClientName'] == client_name:
-            # Update existing client to ensure proper auth flows
-            try:
-                cognito_idp.update_user_pool_client(
-                    UserPoolId=pool_id,
-                    ClientId=client['ClientId'],
-                    ExplicitAuthFlows=[
-                        'ALLOW_USER_PASSWORD_AUTH',
-                        'ALLOW_USER_SRP_AUTH',
-                        'ALLOW_REFRESH_TOKEN_AUTH'
-                    ]
-                )
-                print(
-                    f"Updated existing client {client['ClientId']} with USER_PASSWORD_AUTH and USER_SRP_AUTH flows")
-            except Exception as e:
-                print(f"Warning: Could not update client auth flows: {e}")
-            return client['ClientId']
+    client_id = ids.client_id(pool_id, client_name)
+    if client_id:
+        # Update existing client to ensure proper auth flows
+        try:
+            cognito_idp.update_user_pool_client(
+                UserPoolId=pool_id,
+                ClientId=client_id,
+                ExplicitAuthFlows=[
+                    'ALLOW_USER_PASSWORD_AUTH',
+                    'ALLOW_USER_SRP_AUTH',
+                    'ALLOW_REFRESH_TOKEN_AUTH'
+                ]
+            )
+            print(
+                f"Updated existing client {client_id} with USER_PASSWORD_AUTH and USER_SRP_AUTH flows")
+        except Exception as e:
+            print(f"Warning: Could not update client auth flows: {e}")
+        return client_id
     resp = cognito_idp.create_user_pool_client(
         UserPoolId=pool_id,
         ClientName=client_name,
@@ -63,15 +76,14 @@ def get_or_create_user_pool_client(pool_id, client_name):
             'ALLOW_REFRESH_TOKEN_AUTH'
         ]
     )
+    ids.remember('clients', client_name, resp['UserPoolClient']['ClientId'], user_pool_id=pool_id)
     return resp['UserPoolClient']['ClientId']
 
 
 def get_or_create_identity_pool(name, user_pool_id, app_client_id, region):
-    pools = cognito_identity.list_identity_pools(MaxResults=60)[
-        'IdentityPools']
-    for pool in pools:
-        if pool['IdentityPoolName'] == name:
-            return pool['IdentityPoolId']
+    identity_pool_id = ids.identity_pool_id(name)
+    if identity_pool_id:
+        return identity_pool_id
 
     resp = cognito_identity.create_identity_pool(
         IdentityPoolName=name,
@@ -81,6 +93,7 @@ def get_or_create_identity_pool(name, user_pool_id, app_client_id, region):
             'ClientId': app_client_id
         }]
     )
+    ids.remember('identity_pools', name, resp['IdentityPoolId'])
     return resp['IdentityPoolId']
 
 
@@ -231,6 +244,136 @@ def add_users_to_pool(pool_id, users):
                     f"Warning: Could not update password for {u['email']}: {e}")
 
 
+def snapshot_pool_users(pool_id):
+    """All users in the pool as {username: {status, attrs}}, via one paginated list."""
+    users = {}
+    paginator = cognito_idp.get_paginator('list_users')
+    for page in paginator.paginate(UserPoolId=pool_id):
+        for user in page.get('Users', []):
+            users[user['Username'].lower()] = {
+                'status': user.get('UserStatus'),
+                'attrs': {a['Name']: a['Value'] for a in user.get('Attributes', [])},
+            }
+    return users
+
+
+def plan_user_changes(pool_users, users, reset_passwords=False):
+    """Diff config users against a pool snapshot.
+
+    Returns {create, update, password, skip}, each a list of config users.
+    Passwords cannot be read back from Cognito, so existing users only get
+    their password set if they never left FORCE_CHANGE_PASSWORD (a previous
+    run failed half-way) or reset_passwords is given.
+    """
+    plan = {'create': [], 'update': [], 'password': [], 'skip': []}
+    for u in users:
+        username = u.get('user_id', u['email']).lower()
+        existing = pool_users.get(username)
+        if existing is None:
+            plan['create'].append(u)
+            continue
+        wanted = {'email': u['email'], 'name': u['name'], 'preferred_username': u['user_id']}
+        changed = any(existing['attrs'].get(k) != v for k, v in wanted.items())
+        if changed:
+            plan['update'].append(u)
+        if reset_passwords or existing['status'] == 'FORCE_CHANGE_PASSWORD':
+            plan['password'].append(u)
+        elif not changed:
+            plan['skip'].append(u)
+    return plan
+
+
+def _apply_user_change(pool_id, action, u):
+    username = u.get('user_id', u['email']).lower()
+    if action == 'create':
+        cognito_idp.admin_create_user(
+            UserPoolId=pool_id,
+            Username=username,
+            TemporaryPassword=u['password'],
+            UserAttributes=[
+                {'Name': 'email', 'Value': u['email']},
+                {'Name': 'name', 'Value': u['name']},
+                {'Name': 'preferred_username', 'Value': u['user_id']}
+            ],
+            MessageAction='SUPPRESS'
+        )
+    if action == 'update':
+        cognito_idp.admin_update_user_attributes(
+            UserPoolId=pool_id,
+            Username=username,
+            UserAttributes=[
+                {'Name': 'email', 'Value': u['email']},
+                {'Name': 'name', 'Value': u['name']},
+                {'Name': 'preferred_username', 'Value': u['user_id']}
+            ]
+        )
+    if action in ('create', 'password'):
+        cognito_idp.admin_set_user_password(
+            UserPoolId=pool_id,
+            Username=username,
+            Password=u['password'],
+            Permanent=True
+        )
+
+
+def print_setup_plan(app_name, app_type, role_name):
+    """Dry run of steps 1-5: look the resources up and say what would change.
+
+    Only read calls are made. Returns the user pool ID, or None if the pool
+    would be created.
+    """
+    user_pool_id = ids.user_pool_id(f"{app_name}-user-pool")
+    client_id = ids.client_id(user_pool_id, f"{app_name}-{app_type}-client") if user_pool_id else None
+    identity_pool_id = ids.identity_pool_id(f"{app_name}-identity-pool")
+    try:
+        iam.get_role(RoleName=role_name)
+        role_exists = True
+    except iam.exceptions.NoSuchEntityException:
+        role_exists = False
+    print("Dry run, nothing will be changed:")
+    print(f"  user pool {app_name}-user-pool: " + (f"exists ({user_pool_id})" if user_pool_id else "would create"))
+    print(f"  client {app_name}-{app_type}-client: "
+          + (f"exists ({client_id}), would update auth flows" if client_id else "would create"))
+    print(f"  identity pool {app_name}-identity-pool: "
+          + (f"exists ({identity_pool_id})" if identity_pool_id else "would create"))
+    print(f"  role {role_name}: " + ("exists, would update policy" if role_exists else "would create"))
+    print("  would set the role as the identity pool's authenticated role")
+    return user_pool_id
+
+
+def reconcile_users(pool_id, users, workers=8, reset_passwords=False, dry_run=False):
+    # A dry run against a pool that does not exist yet plans to create everyone.
+    pool_users = snapshot_pool_users(pool_id) if pool_id else {}
+    plan = plan_user_changes(pool_users, users, reset_passwords)
+    print(f"Pool has {len(pool_users)} users; config has {len(users)}")
+    print(
+        f"Plan: create {len(plan['create'])}, update {len(plan['update'])}, "
+        f"set password {len(plan['password'])}, unchanged {len(plan['skip'])}")
+    if dry_run:
+        for action in ('create', 'update', 'password'):
+            for u in plan[action]:
+                print(f"  {action}: {u['email']}")
+        return plan
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_apply_user_change, pool_id, action, u): (action, u)
+            for action in ('create', 'update', 'password')
+            for u in plan[action]
+        }
+        for fut in as_completed(futures):
+            action, u = futures[fut]
+            try:
+                fut.result()
+                print(f"{action}: {u['email']} ok")
+            except Exception as e:
+                failures += 1
+                print(f"{action}: {u['email']} FAILED: {e}")
+    print(f"Reconcile done with {failures} failures")
+    return plan
+
+
 @click.command()
 @click.option('--app-name', default='fomomon', help='Base name for Cognito resources')
 # TODO(prashanth@): add these as enums
@@ -238,7 +381,11 @@ def add_users_to_pool(pool_id, users):
 @click.option('--write', default='true', help='Write access (true/false)')
 @click.option('--user-config', required=True, help='Path to user config JSON')
 @click.option('--region', default='ap-south-1', help='AWS region')
-def main(app_name, app_type, write, user_config, region):
+@click.option('--reconcile', is_flag=True, help='Only create/update users that differ from the pool')
+@click.option('--reset-passwords', is_flag=True, help='With --reconcile, also reset passwords of existing users')
+@click.option('--workers', default=8, help='With --reconcile, concurrent Cognito calls')
+@click.option('--dry-run', is_flag=True, help='Print what would change without changing anything (implies --reconcile)')
+def main(app_name, app_type, write, user_config, region, reconcile, reset_passwords, workers, dry_run):
     write_access = (write.lower() == 'true')
 
     # Load user config
@@ -246,28 +393,42 @@ def main(app_name, app_type, write, user_config, region):
         config = json.load(f)
     bucket_root = config['bucket_root']
     users = config['users']
+    role_name = f"{app_name}-{app_type}-role"
 
-    # 1. Create/find User Pool
-    user_pool_id = get_or_create_user_pool(f"{app_name}-user-pool")
+    # A cached ID can point at a pool or client deleted since it was cached;
+    # retry_stale re-lists and runs the lookups (and creates) again.
+    if dry_run:
+        user_pool_id = ids.retry_stale(lambda: print_setup_plan(app_name, app_type, role_name))
+        reconcile_users(user_pool_id, users, workers, reset_passwords, dry_run=True)
+        return
 
-    # 2. Create/find User Pool Client for app_type
-    client_id = get_or_create_user_pool_client(
-        user_pool_id, f"{app_name}-{app_type}-client")
+    def setup():
+        # 1. Create/find User Pool
+        user_pool_id = get_or_create_user_pool(f"{app_name}-user-pool")
 
-    # 3. Create/find Identity Pool
-    identity_pool_id = get_or_create_identity_pool(
-        f"{app_name}-identity-pool", user_pool_id, client_id, region)
+        # 2. Create/find User Pool Client for app_type
+        client_id = get_or_create_user_pool_client(
+            user_pool_id, f"{app_name}-{app_type}-client")
 
-    # 4. Create/find IAM Role scoped to bucket_root
-    role_name = f"{app_name}-{app_type}-role"
-    role_arn = get_or_create_role(
-        role_name, bucket_root, write_access, identity_pool_id)
+        # 3. Create/find Identity Pool
+        identity_pool_id = get_or_create_identity_pool(
+            f"{app_name}-identity-pool", user_pool_id, client_id, region)
+
+        # 4. Create/find IAM Role scoped to bucket_root
+        role_arn = get_or_create_role(
+            role_name, bucket_root, write_access, identity_pool_id)
 
-    # 5. Attach role to Identity Pool (authenticated role)
-    attach_role_to_identity_pool(identity_pool_id, role_arn)
+        # 5. Attach role to Identity Pool (authenticated role)
+        attach_role_to_identity_pool(identity_pool_id, role_arn)
+        return user_pool_id, client_id, identity_pool_id, role_arn
+
+    user_pool_id, client_id, identity_pool_id, role_arn = ids.retry_stale(setup)
 
     # 6. Add users
-    add_users_to_pool(user_pool_id, users)
+    if reconcile:
+        reconcile_users(user_pool_id, users, workers, reset_passwords)
+    else:
+        add_users_to_pool(user_pool_id, users)
 
     print(
         f"Setup complete:\nUser Pool ID: {user_pool_id}\nClient ID: {client_id}\nIdentity Pool ID: {identity_pool_id}\nRole ARN: {role_arn}")
@@ -7,168 +7,154 @@
 #   Delete only users from config
 #       python hack/cognito/delete_users.py --user-config ./org1_users.json
 #       --app-name org1 --app-type phone --region ap-south-1
+#   Print what would be deleted, stage by stage, without deleting anything
+#       python hack/cognito/delete_users.py --all --dry-run
+#
+# Deletions run as a plan of stages in dependency order (users, clients, user
+# pools, identity pools, role policies, roles). Each stage runs --workers
+# deletes in parallel; a stage with failures stops the run, and re-running
+# rebuilds the plan from whatever is left.
 
 import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import boto3
 import click
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# Shared Cognito helpers from the admin backend: the name -> ID resolver
+# (paginated, cached on disk) and the rate-limited, retrying client.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'admin', 'backend'))
+from cognito_ids import CognitoIdResolver, default_cache_dir  # noqa: E402
+from cognito_throttle import cognito_client  # noqa: E402
+
+# IAM calls use adaptive retry mode, which rate-limits the client and backs
+# off on throttling; Cognito calls go through the shared throttle.
+RETRY_CONFIG = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
 
 # Initialize AWS clients
-cognito_idp = boto3.client('cognito-idp')
-cognito_identity = boto3.client('cognito-identity')
-iam = boto3.client('iam')
+cognito_idp = cognito_client('cognito-idp')
+cognito_identity = cognito_client('cognito-identity')
+iam = boto3.client('iam', config=RETRY_CONFIG)
+ids = CognitoIdResolver(cognito_idp, cognito_identity, cache_dir=default_cache_dir())
 
+TEARDOWN_STAGES = ('users', 'clients', 'user_pools',
+                   'identity_pools', 'role_policies', 'roles')
 
-def get_user_pool_id(app_name):
-    """Get User Pool ID by name"""
-    pools = cognito_idp.list_user_pools(MaxResults=60)['UserPools']
-    for pool in pools:
-        if pool['Name'] == f"{app_name}-user-pool":
-            return pool['Id']
-    return None
+NOT_FOUND_CODES = ('UserNotFoundException', 'ResourceNotFoundException',
+                   'NoSuchEntity', 'NoSuchEntityException')
 
 
-def get_user_pool_client_id(user_pool_id, app_name, app_type):
-    """Get User Pool Client ID by name"""
-    if not user_pool_id:
-        return None
-    clients = cognito_idp.list_user_pool_clients(
-        UserPoolId=user_pool_id, MaxResults=60)['UserPoolClients']
-    for client in clients:
-        if client['ClientName'] == f"{app_name}-{app_type}-client":
-            return client['ClientId']
-    return None
+def get_user_pool_id(app_name):
+    """Get User Pool ID by name"""
+    return ids.user_pool_id(f"{app_name}-user-pool")
 
 
 def get_identity_pool_id(app_name, region):
     """Get Identity Pool ID by name"""
-    pools = cognito_identity.list_identity_pools(MaxResults=60)[
-        'IdentityPools']
-    for pool in pools:
-        if pool['IdentityPoolName'] == f"{app_name}-identity-pool":
-            return pool['IdentityPoolId']
-    return None
-
-
-def delete_users_from_pool(pool_id, users):
-    """Delete specific users from a User Pool"""
-    if not pool_id:
-        print("No User Pool found")
-        return
+    return ids.identity_pool_id(f"{app_name}-identity-pool")
 
-    for u in users:
-        username = u.get('user_id', u['email']).lower()
-        try:
-            cognito_idp.admin_delete_user(
-                UserPoolId=pool_id,
-                Username=username
-            )
-            print(f"Deleted user: {username}")
-        except cognito_idp.exceptions.UserNotFoundException:
-            print(f"User {username} not found, skipping")
-        except Exception as e:
-            print(f"Error deleting user {username}: {e}")
-
-
-def delete_user_pool_clients(user_pool_id, app_name, app_type):
-    """Delete User Pool Clients"""
-    if not user_pool_id:
-        return
 
-    clients = cognito_idp.list_user_pool_clients(
-        UserPoolId=user_pool_id, MaxResults=60)['UserPoolClients']
+def plan_teardown(app_name, app_type, region, delete_all, users=None):
+    """Build {stage: [(label, fn, kwargs)]} for everything that currently exists.
 
-    for client in clients:
-        if client['ClientName'] == f"{app_name}-{app_type}-client":
-            try:
-                cognito_idp.delete_user_pool_client(
-                    UserPoolId=user_pool_id,
-                    ClientId=client['ClientId']
-                )
-                print(f"Deleted User Pool Client: {client['ClientName']}")
-            except Exception as e:
-                print(f"Error deleting client {client['ClientName']}: {e}")
+    With delete_all, every user in the pool is deleted (revoking sessions
+    before the pool goes), followed by the app's client, the pool, the
+    identity pool and the role. Otherwise only the given config users.
+    """
+    plan = {stage: [] for stage in TEARDOWN_STAGES}
+    user_pool_id = get_user_pool_id(app_name)
 
+    if user_pool_id:
+        if delete_all:
+            usernames = []
+            for page in cognito_idp.get_paginator('list_users').paginate(UserPoolId=user_pool_id):
+                usernames.extend(u['Username'] for u in page.get('Users', []))
+        else:
+            usernames = [u.get('user_id', u['email']).lower() for u in users or []]
+        for username in usernames:
+            plan['users'].append((f"user {username}", cognito_idp.admin_delete_user,
+                                  {'UserPoolId': user_pool_id, 'Username': username}))
+
+    if not delete_all:
+        return plan
+
+    if user_pool_id:
+        client_name = f"{app_name}-{app_type}-client"
+        paginator = cognito_idp.get_paginator('list_user_pool_clients')
+        for page in paginator.paginate(UserPoolId=user_pool_id):
+            for client in page.get('UserPoolClients', []):
+                if client['ClientName'] == client_name:
+                    plan['clients'].append((f"client {client_name} ({client['ClientId']})",
+                                            cognito_idp.delete_user_pool_client,
+                                            {'UserPoolId': user_pool_id, 'ClientId': client['ClientId']}))
+        plan['user_pools'].append((f"user pool {app_name}-user-pool ({user_pool_id})",
+                                   cognito_idp.delete_user_pool, {'UserPoolId': user_pool_id}))
 
-def delete_identity_pool(app_name, region):
-    """Delete Identity Pool"""
     identity_pool_id = get_identity_pool_id(app_name, region)
-    if not identity_pool_id:
-        print(f"Identity Pool '{app_name}-identity-pool' not found")
-        return
-
-    try:
-        cognito_identity.delete_identity_pool(IdentityPoolId=identity_pool_id)
-        print(f"Deleted Identity Pool: {app_name}-identity-pool")
-    except Exception as e:
-        print(f"Error deleting identity pool: {e}")
-
+    if identity_pool_id:
+        plan['identity_pools'].append((f"identity pool {app_name}-identity-pool ({identity_pool_id})",
+                                       cognito_identity.delete_identity_pool,
+                                       {'IdentityPoolId': identity_pool_id}))
 
-def delete_iam_role(app_name, app_type):
-    """Delete IAM Role and its policies"""
     role_name = f"{app_name}-{app_type}-role"
-
     try:
-        # List and delete inline policies
-        policies = iam.list_role_policies(RoleName=role_name)['PolicyNames']
-        for policy_name in policies:
-            try:
-                iam.delete_role_policy(
-                    RoleName=role_name, PolicyName=policy_name)
-                print(f"Deleted inline policy: {policy_name}")
-            except Exception as e:
-                print(f"Error deleting inline policy {policy_name}: {e}")
-
-        # List and detach managed policies
-        attached_policies = iam.list_attached_role_policies(RoleName=role_name)[
-            'AttachedPolicies']
-        for policy in attached_policies:
-            try:
-                iam.detach_role_policy(
-                    RoleName=role_name, PolicyArn=policy['PolicyArn'])
-                print(f"Detached managed policy: {policy['PolicyName']}")
-            except Exception as e:
-                print(
-                    f"Error detaching managed policy {policy['PolicyName']}: {e}")
-
-        # Delete the role
-        iam.delete_role(RoleName=role_name)
-        print(f"Deleted IAM Role: {role_name}")
-
+        for page in iam.get_paginator('list_role_policies').paginate(RoleName=role_name):
+            for policy_name in page['PolicyNames']:
+                plan['role_policies'].append((f"inline policy {policy_name}", iam.delete_role_policy,
+                                              {'RoleName': role_name, 'PolicyName': policy_name}))
+        for page in iam.get_paginator('list_attached_role_policies').paginate(RoleName=role_name):
+            for policy in page['AttachedPolicies']:
+                plan['role_policies'].append((f"managed policy {policy['PolicyName']}", iam.detach_role_policy,
+                                              {'RoleName': role_name, 'PolicyArn': policy['PolicyArn']}))
+        plan['roles'].append((f"role {role_name}", iam.delete_role, {'RoleName': role_name}))
     except iam.exceptions.NoSuchEntityException:
-        print(f"IAM Role {role_name} not found")
-    except Exception as e:
-        print(f"Error deleting IAM role {role_name}: {e}")
-
-
-def delete_user_pool(app_name):
-    """Delete User Pool and all its contents"""
-    user_pool_id = get_user_pool_id(app_name)
-    if not user_pool_id:
-        print(f"User Pool '{app_name}-user-pool' not found")
-        return
-
-    try:
-        cognito_idp.delete_user_pool(UserPoolId=user_pool_id)
-        print(f"Deleted User Pool: {app_name}-user-pool")
-    except Exception as e:
-        print(f"Error deleting user pool: {e}")
-
-
-def delete_all_resources(app_name, app_type, region):
-    """Delete all Cognito resources for the app"""
-    print(f"Deleting all resources for {app_name}-{app_type}...")
-
-    # Delete in reverse order of dependencies
-    # 1. Delete Identity Pool first (depends on User Pool Client)
-    delete_identity_pool(app_name, region)
-
-    # 2. Delete IAM Role
-    delete_iam_role(app_name, app_type)
-
-    # 3. Delete User Pool (this will delete all clients and users)
-    delete_user_pool(app_name)
-
-    print("All resources deleted successfully!")
+        pass
+    return plan
+
+
+def print_teardown_plan(plan, verbose=False):
+    total = sum(len(tasks) for tasks in plan.values())
+    print(f"Teardown plan: {total} deletions")
+    for stage in TEARDOWN_STAGES:
+        print(f"  {stage}: {len(plan[stage])}")
+        if verbose:
+            for label, _, _ in plan[stage]:
+                print(f"    {label}")
+
+
+def run_teardown(plan, workers=8):
+    """Run stages in order, each with up to `workers` parallel deletes.
+
+    Returns the number of failures; stops after the first stage with any.
+    """
+    for stage in TEARDOWN_STAGES:
+        tasks = plan[stage]
+        if not tasks:
+            continue
+        print(f"Stage {stage}: deleting {len(tasks)}...")
+        failures = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(fn, **kwargs): label for label, fn, kwargs in tasks}
+            for fut in as_completed(futures):
+                label = futures[fut]
+                try:
+                    fut.result()
+                    print(f"  Deleted {label}")
+                except ClientError as e:
+                    if e.response.get('Error', {}).get('Code') in NOT_FOUND_CODES:
+                        print(f"  {label} already gone")
+                    else:
+                        failures += 1
+                        print(f"  Error deleting {label}: {e}")
+        if failures:
+            print(f"Stage {stage} had {failures} failures; stopping. Re-run to resume.")
+            return failures
+    print("Teardown complete")
+    return 0
 
 
 @click.command()
@@ -177,32 +163,36 @@ def delete_all_resources(app_name, app_type, region):
 @click.option('--user-config', help='Path to user config JSON (for deleting specific users)')
 @click.option('--all', is_flag=True, help='Delete all Cognito resources (pools, clients, identity pools, roles)')
 @click.option('--region', default='ap-south-1', help='AWS region')
-def main(app_name, app_type, user_config, all, region):
+@click.option('--workers', default=8, help='Parallel deletes within each stage')
+@click.option('--dry-run', is_flag=True, help='Print the teardown plan without deleting anything')
+def main(app_name, app_type, user_config, all, region, workers, dry_run):
     """Delete Cognito users and optionally all resources"""
 
     if not all and not user_config:
         print("Error: Must specify either --all or --user-config")
         return
 
-    if all:
-        delete_all_resources(app_name, app_type, region)
-
+    users = None
     if user_config:
         # Load user config
         with open(user_config) as f:
             config = json.load(f)
         users = config['users']
-
         if all:
-            print("Note: Users were already deleted with --all flag")
-        else:
-            # Delete only specific users, preserve pools
-            user_pool_id = get_user_pool_id(app_name)
-            if user_pool_id:
-                print(f"Deleting users from {app_name}-user-pool...")
-                delete_users_from_pool(user_pool_id, users)
-            else:
-                print(f"User Pool '{app_name}-user-pool' not found")
+            print("Note: --all deletes every user in the pool, including those in the config")
+
+    if not all and not get_user_pool_id(app_name):
+        print(f"User Pool '{app_name}-user-pool' not found")
+        return
+
+    plan = plan_teardown(app_name, app_type, region, all, users)
+    print_teardown_plan(plan, verbose=dry_run)
+    if dry_run:
+        return
+    run_teardown(plan, workers)
+    if all:
+        # Deleted pools and clients must not be served from the ID cache.
+        ids.invalidate()
 
 
 if __name__ == '__main__':
@@ -1,43 +1,39 @@
 #!/usr/bin/env python3
 
+import os
+import sys
+
 import boto3
 import click
 
+# Shared Cognito helpers from the admin backend: the name -> ID resolver
+# (paginated, cached on disk) and the rate-limited, retrying client.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'admin', 'backend'))
+from cognito_ids import CognitoIdResolver, default_cache_dir  # noqa: E402
+from cognito_throttle import cognito_client  # noqa: E402
+
 # Initialize AWS clients
-cognito_idp = boto3.client('cognito-idp')
-cognito_identity = boto3.client('cognito-identity')
+cognito_idp = cognito_client('cognito-idp')
+cognito_identity = cognito_client('cognito-identity')
 iam = boto3.client('iam')
+ids = CognitoIdResolver(cognito_idp, cognito_identity, cache_dir=default_cache_dir())
 
 
 def get_user_pool_id(app_name):
     """Get User Pool ID by name"""
-    pools = cognito_idp.list_user_pools(MaxResults=60)['UserPools']
-    for pool in pools:
-        if pool['Name'] == f"{app_name}-user-pool":
-            return pool['Id']
-    return None
+    return ids.user_pool_id(f"{app_name}-user-pool")
 
 
 def get_user_pool_client_id(user_pool_id, app_name, app_type):
     """Get User Pool Client ID by name"""
     if not user_pool_id:
         return None
-    clients = cognito_idp.list_user_pool_clients(
-        UserPoolId=user_pool_id, MaxResults=60)['UserPoolClients']
-    for client in clients:
-        if client['ClientName'] == f"{app_name}-{app_type}-client":
-            return client['ClientId']
-    return None
+    return ids.client_id(user_pool_id, f"{app_name}-{app_type}-client")
 
 
 def get_identity_pool_id(app_name):
     """Get Identity Pool ID by name"""
-    pools = cognito_identity.list_identity_pools(MaxResults=60)[
-        'IdentityPools']
-    for pool in pools:
-        if pool['IdentityPoolName'] == f"{app_name}-identity-pool":
-            return pool['IdentityPoolId']
-    return None
+    return ids.identity_pool_id(f"{app_name}-identity-pool")
 
 
 def get_role_arn(app_name, app_type):
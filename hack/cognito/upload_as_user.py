@@ -7,19 +7,46 @@
 #           --app-type phone \    (optional)
 #           --bucket-name fomomon \    (optional)
 #           --path org1/file.jpg \    (required)
-#           --file ./file.jpg \    (required)
+#           --file ./file.jpg \    (--file or --dir required)
+#           --dir ./backfill \    (uploads the tree under --path)
 #           --user user@example.com \    (required)
 #           --password password \    (required)
 #           --region ap-south-1 \    (optional)
+#           --workers 8 \    (optional, --dir only)
 #
-# This will upload the file to the S3 bucket as the user.
+# This will upload the file (or every file under --dir, keeping relative
+# paths) to the S3 bucket as the user. With --dir, files already in the
+# bucket with the same size and ETag are skipped, so a re-run only uploads
+# what is new or changed.
+#
+# The user's temporary AWS credentials are cached in ~/.cache/fomomon and
+# reused until shortly before they expire, so repeated runs skip the
+# Cognito sign-in. Long runs refresh them in place.
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
 import boto3
 import click
-import os
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+from botocore.exceptions import ClientError
+from botocore.session import get_session
+
+# Shared Cognito helpers from the admin backend: the name -> ID resolver
+# (paginated, cached on disk) and the rate-limited, retrying client.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'admin', 'backend'))
+from cognito_ids import CognitoIdResolver, default_cache_dir  # noqa: E402
+from cognito_throttle import cognito_client  # noqa: E402
 
 # Initialize AWS clients
-cognito_idp = boto3.client('cognito-idp')
-cognito_identity = boto3.client('cognito-identity')
+cognito_idp = cognito_client('cognito-idp')
+cognito_identity = cognito_client('cognito-identity')
+ids = CognitoIdResolver(cognito_idp, cognito_identity, cache_dir=default_cache_dir())
 
 # ------------------------------
 # Helper: Idempotent find-or-create
@@ -28,31 +55,26 @@ cognito_identity = boto3.client('cognito-identity')
 
 def get_user_pool_id(app_name):
     """Get User Pool ID by name"""
-    pools = cognito_idp.list_user_pools(MaxResults=60)['UserPools']
-    for pool in pools:
-        if pool['Name'] == f"{app_name}-user-pool":
-            return pool['Id']
+    pool_id = ids.user_pool_id(f"{app_name}-user-pool")
+    if pool_id:
+        return pool_id
     raise ValueError(f"User Pool '{app_name}-user-pool' not found")
 
 
 def get_user_pool_client_id(user_pool_id, app_name, app_type):
     """Get User Pool Client ID by name"""
-    clients = cognito_idp.list_user_pool_clients(
-        UserPoolId=user_pool_id, MaxResults=60)['UserPoolClients']
-    for client in clients:
-        if client['ClientName'] == f"{app_name}-{app_type}-client":
-            return client['ClientId']
+    client_id = ids.client_id(user_pool_id, f"{app_name}-{app_type}-client")
+    if client_id:
+        return client_id
     raise ValueError(
         f"User Pool Client '{app_name}-{app_type}-client' not found")
 
 
 def get_identity_pool_id(app_name, region):
     """Get Identity Pool ID by name"""
-    pools = cognito_identity.list_identity_pools(MaxResults=60)[
-        'IdentityPools']
-    for pool in pools:
-        if pool['IdentityPoolName'] == f"{app_name}-identity-pool":
-            return pool['IdentityPoolId']
+    identity_pool_id = ids.identity_pool_id(f"{app_name}-identity-pool")
+    if identity_pool_id:
+        return identity_pool_id
     raise ValueError(f"Identity Pool '{app_name}-identity-pool' not found")
 
 
@@ -60,7 +82,7 @@ def authenticate_user(email, password, client_id, region):
     """
     Authenticate user via Cognito User Pool to get ID token
     """
-    client = boto3.client('cognito-idp', region_name=region)
+    client = cognito_client('cognito-idp', region_name=region)
     try:
         resp = client.initiate_auth(
             AuthFlow='USER_PASSWORD_AUTH',
@@ -94,7 +116,7 @@ def get_aws_credentials(id_token, identity_pool_id, user_pool_id, region):
     """
     Exchange ID token for temporary AWS creds via Identity Pool
     """
-    client = boto3.client('cognito-identity', region_name=region)
+    client = cognito_client('cognito-identity', region_name=region)
     # Step 1: Get identity ID
     identity = client.get_id(
         IdentityPoolId=identity_pool_id,
@@ -111,32 +133,126 @@ def get_aws_credentials(id_token, identity_pool_id, user_pool_id, region):
     return creds['Credentials']
 
 
+# Multipart settings for uploads. Local ETags are computed with the same
+# threshold and part size so they can be compared with what S3 reports.
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4,
+)
+
+# Cached credentials are reused only while they have longer than this left,
+# which is also past the point where botocore would refresh them itself.
+CREDENTIALS_MIN_TTL = timedelta(minutes=16)
+
+
+def _credentials_cache_path(app_name, app_type, region, email):
+    key = hashlib.sha256(f"{region}|{app_name}|{app_type}|{email.lower()}".encode()).hexdigest()[:16]
+    return default_cache_dir() / f"upload_creds-{key}.json"
+
+
+def _load_cached_credentials(path):
+    try:
+        metadata = json.loads(path.read_text())
+        expiry = datetime.fromisoformat(metadata['expiry_time'])
+    except (OSError, ValueError, KeyError):
+        return None
+    if expiry - datetime.now(timezone.utc) < CREDENTIALS_MIN_TTL:
+        return None
+    return metadata
+
+
+def _save_cached_credentials(path, metadata):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(tmp, path)
+
+
+class CognitoIdentityCredentialProvider(CredentialProvider):
+    """Credential provider that signs in through the Identity Pool via fetch()"""
+    METHOD = 'cognito-identity'
+    CANONICAL_NAME = 'cognito-identity'
+
+    def __init__(self, fetch):
+        super().__init__()
+        self._fetch = fetch
+
+    def load(self):
+        return RefreshableCredentials.create_from_metadata(
+            metadata=self._fetch(), refresh_using=self._fetch, method=self.METHOD)
+
+
+def user_session(email, password, app_name, app_type, region):
+    """
+    boto3 Session with the user's Identity Pool credentials, cached on disk
+    and refreshed automatically before they expire
+    """
+    cache_path = _credentials_cache_path(app_name, app_type, region, email)
+
+    def fetch():
+        cached = _load_cached_credentials(cache_path)
+        if cached:
+            return cached
+
+        def sign_in():
+            user_pool_id = get_user_pool_id(app_name)
+            client_id = get_user_pool_client_id(user_pool_id, app_name, app_type)
+            identity_pool_id = get_identity_pool_id(app_name, region)
+            id_token = authenticate_user(email, password, client_id, region)
+            return get_aws_credentials(id_token, identity_pool_id, user_pool_id, region)
+
+        # Cached IDs may name a pool or client deleted since; re-list and retry.
+        creds = ids.retry_stale(sign_in)
+        metadata = {
+            'access_key': creds['AccessKeyId'],
+            'secret_key': creds['SecretKey'],
+            'token': creds['SessionToken'],
+            'expiry_time': creds['Expiration'].astimezone(timezone.utc).isoformat(),
+        }
+        _save_cached_credentials(cache_path, metadata)
+        return metadata
+
+    # Ahead of the env/profile providers, so the user's credentials win over
+    # whatever admin credentials this shell has.
+    botocore_session = get_session()
+    botocore_session.get_component('credential_provider').insert_before(
+        'env', CognitoIdentityCredentialProvider(fetch))
+    return boto3.Session(botocore_session=botocore_session, region_name=region)
+
+
+def local_etag(file_path, size):
+    """The ETag S3 gives this file when uploaded with TRANSFER_CONFIG"""
+    chunk = TRANSFER_CONFIG.multipart_chunksize
+    with open(file_path, 'rb') as f:
+        if size < TRANSFER_CONFIG.multipart_threshold:
+            return hashlib.md5(f.read()).hexdigest()
+        digests = [hashlib.md5(part).digest() for part in iter(lambda: f.read(chunk), b'')]
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def already_uploaded(s3, bucket_name, key, file_path):
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=key)
+    except ClientError as e:
+        # Without s3:ListBucket a missing key is a 403, not a 404.
+        if e.response.get('Error', {}).get('Code') in ('404', '403', 'NoSuchKey'):
+            return False
+        raise
+    size = os.path.getsize(file_path)
+    if head['ContentLength'] != size:
+        return False
+    return head['ETag'].strip('"') == local_etag(file_path, size)
+
+
 def upload_file_as_user(bucket_name, path, file_path, email, password, app_name, app_type, region):
     """
     Upload file to S3 using Cognito-authenticated user's credentials
     """
-    # Get Cognito resource IDs
-    user_pool_id = get_user_pool_id(app_name)
-    client_id = get_user_pool_client_id(user_pool_id, app_name, app_type)
-    identity_pool_id = get_identity_pool_id(app_name, region)
-
-    # 1. Authenticate user to get ID token
-    id_token = authenticate_user(email, password, client_id, region)
-
-    # 2. Exchange ID token for AWS temp credentials
-    creds = get_aws_credentials(
-        id_token, identity_pool_id, user_pool_id, region)
-
-    # 3. Create S3 client with temp creds
-    s3 = boto3.client(
-        's3',
-        region_name=region,
-        aws_access_key_id=creds['AccessKeyId'],
-        aws_secret_access_key=creds['SecretKey'],
-        aws_session_token=creds['SessionToken']
-    )
+    s3 = user_session(email, password, app_name, app_type, region).client('s3')
 
-    # 4. Upload file
     # Extract filename from file_path
     filename = os.path.basename(file_path)
 
@@ -145,20 +261,71 @@ def upload_file_as_user(bucket_name, path, file_path, email, password, app_name,
     clean_path = path.rstrip('/')
     s3_key = f"{clean_path}/{filename}"
 
-    s3.upload_file(file_path, bucket_name, s3_key)
+    s3.upload_file(file_path, bucket_name, s3_key, Config=TRANSFER_CONFIG)
     print(f"Uploaded {file_path} to s3://{bucket_name}/{s3_key} as {email}")
 
 
+def upload_dir_as_user(bucket_name, path, dir_path, email, password, app_name, app_type, region, workers=8):
+    """
+    Upload every file under dir_path to path/<relative path>, skipping files
+    already in the bucket with the same size and ETag
+    """
+    # Every worker's transfer opens up to max_concurrency connections; the
+    # default pool of 10 would make them queue for one.
+    s3 = user_session(email, password, app_name, app_type, region).client(
+        's3', config=Config(max_pool_connections=workers * TRANSFER_CONFIG.max_concurrency))
+    clean_path = path.rstrip('/')
+    files = []
+    for root, _, names in os.walk(dir_path):
+        for name in sorted(names):
+            local = os.path.join(root, name)
+            rel = os.path.relpath(local, dir_path).replace(os.sep, '/')
+            files.append((local, f"{clean_path}/{rel}" if clean_path else rel))
+
+    def upload(local, key):
+        if already_uploaded(s3, bucket_name, key, local):
+            return 'skipped'
+        s3.upload_file(local, bucket_name, key, Config=TRANSFER_CONFIG)
+        return 'uploaded'
+
+    counts = {'uploaded': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(upload, local, key): (local, key) for local, key in files}
+        for fut in as_completed(futures):
+            local, key = futures[fut]
+            try:
+                status = fut.result()
+            except Exception as e:
+                status = 'failed'
+                print(f"Error uploading {local}: {e}")
+            counts[status] += 1
+            if status == 'uploaded':
+                print(f"Uploaded {local} to s3://{bucket_name}/{key}")
+    print(f"{counts['uploaded']} uploaded, {counts['skipped']} already present, "
+          f"{counts['failed']} failed ({len(files)} files) as {email}")
+    return counts
+
+
 @click.command()
 @click.option('--app-name', default='fomomon', help='Base name for Cognito resources')
 @click.option('--app-type', default='phone', help='App type (phone, web, etc.)')
 @click.option('--bucket-name', default='fomomon', help='S3 bucket name')
 @click.option('--path', required=True, help='Path inside bucket (e.g., org1/file.jpg)')
-@click.option('--file', required=True, help='Local file to upload')
+@click.option('--file', help='Local file to upload')
+@click.option('--dir', 'dir_path', help='Local directory to upload, keeping relative paths under --path')
 @click.option('--user', required=True, help='User email (Cognito username)')
 @click.option('--password', required=True, help='User password')
 @click.option('--region', default='ap-south-1', help='AWS region')
-def main(app_name, app_type, bucket_name, path, file, user, password, region):
+@click.option('--workers', default=8, help='Concurrent file uploads with --dir')
+def main(app_name, app_type, bucket_name, path, file, dir_path, user, password, region, workers):
+    if bool(file) == bool(dir_path):
+        raise click.UsageError("Pass exactly one of --file or --dir")
+    if dir_path:
+        counts = upload_dir_as_user(bucket_name, path, dir_path, user, password,
+                                    app_name, app_type, region, workers)
+        if counts['failed']:
+            sys.exit(1)
+        return
     upload_file_as_user(bucket_name, path, file, user,
                         password, app_name, app_type, region)
 